@@ -6,6 +6,7 @@ import os
 import sys
 import time
 import json
+import threading
 from pathlib import Path
 import traceback
 from datetime import datetime
@@ -15,8 +16,11 @@ from rich.progress import Progress, TextColumn, BarColumn, TimeElapsedColumn, Ti
 from rich.table import Table
 
 from src.cracker import RARCracker
-from src.utils import estimate_combinations, format_speed, load_checkpoint, save_checkpoint
-from src.config import DEFAULT_CHARSET, DEFAULT_SPECIAL_CHARS, YEARS_RANGE
+from src.utils import estimate_combinations, format_speed, load_checkpoint, save_checkpoint, flush_checkpoint
+from src.config import (
+    DEFAULT_CHARSET, YEARS_RANGE,
+    LOWERCASE_CHARS, UPPERCASE_CHARS, DIGIT_CHARS, SPECIAL_CHARS
+)
 
 # Optional imports
 try:
@@ -52,9 +56,10 @@ def parse_arguments():
     # 硬件参数
     parser.add_argument('--backend', default='auto', choices=['auto', 'cpu', 'cuda'], help='计算后端 (auto, cpu, cuda)')
     parser.add_argument('--gpu', type=int, default=0, help='使用的GPU ID (仅CUDA)')
+    parser.add_argument('--gpus', default=None, help='逗号分隔的GPU ID列表，多卡并行暴力破解（例如 0,1,2）')
     parser.add_argument('--threads_per_block', type=int, default=256, help='CUDA每个块的线程数')
-    parser.add_argument('--batch_size', type=int, default=100000, help='每批处理的密码数量')
-    parser.add_argument('--concurrent_batches', type=int, default=2, help='并行批次数')
+    parser.add_argument('--batch_size', type=int, default=None, help='每批处理的密码数量（默认启动时自动调优）')
+    parser.add_argument('--concurrent_batches', type=int, default=3, help='并行批次数（3=上传/计算/回传三重缓冲）')
     parser.add_argument('--shared_mem_size', type=int, default=None, help='每块共享内存大小(字节)')
     
     # 其他参数
@@ -64,26 +69,24 @@ def parse_arguments():
     
     return parser.parse_args()
 
+# 字符集开关与config常量的映射：字面量只在config.py定义一份，
+# 避免此处复制的字符集与掩码符号表悄悄不一致
+_CHARSET_FLAGS = [
+    ('use_lowercase', LOWERCASE_CHARS),
+    ('use_uppercase', UPPERCASE_CHARS),
+    ('use_digits', DIGIT_CHARS),
+    ('use_special', SPECIAL_CHARS),
+]
+
 def get_charset(args):
     """根据参数生成字符集"""
     if args.charset:
         return args.charset
-    
-    charset = ""
-    if args.use_lowercase:
-        charset += "abcdefghijklmnopqrstuvwxyz"
-    if args.use_uppercase:
-        charset += "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    if args.use_digits:
-        charset += "0123456789"
-    if args.use_special:
-        charset += DEFAULT_SPECIAL_CHARS
-    
+
+    parts = [chars for flag, chars in _CHARSET_FLAGS if getattr(args, flag)]
+
     # 如果没有选择任何字符集，使用默认值
-    if not charset:
-        charset = DEFAULT_CHARSET
-    
-    return charset
+    return ''.join(parts) if parts else DEFAULT_CHARSET
 
 def main():
     """主程序入口"""
@@ -117,9 +120,28 @@ def main():
             refresh_per_second=5
         ) as progress:
             task = progress.add_task("[cyan]正在破解密码...", total=None)
-            
+
             start_time = time.time()
-            
+
+            # 进度渲染放到后台线程：热循环只累加一个整数计数器
+            # （GIL下int累加是原子的），f-string格式化和time.time()
+            # 不再出现在每个批次的路径上
+            stats = {'attempts': 0}
+            stop_updater = threading.Event()
+
+            def _progress_updater():
+                while not stop_updater.wait(args.update_interval):
+                    elapsed = time.time() - start_time
+                    attempts = stats['attempts']
+                    speed = attempts / elapsed if elapsed > 0 else 0
+                    progress.update(
+                        task,
+                        description=f"[cyan]正在破解密码... 速度: {format_speed(speed)}/秒 | 已尝试: {attempts:,} 组合[/cyan]"
+                    )
+
+            updater = threading.Thread(target=_progress_updater, daemon=True)
+            updater.start()
+
             # 读取断点
             start_position = None
             if args.resume and os.path.exists(args.checkpoint):
@@ -136,47 +158,39 @@ def main():
                     min_length=args.min_length,
                     max_length=args.max_length,
                     dict_file=args.dict,
+                    use_years=args.use_years,
                     batch_size=args.batch_size,
+                    concurrent_batches=args.concurrent_batches,
                     backend=args.backend,
                     gpu_id=args.gpu,
+                    gpu_ids=[int(g) for g in args.gpus.split(',')] if args.gpus else None,
                     charset=charset
                 )
                 
                 # 持续运行直到成功
-                last_update = time.time()
                 for result in cracker.run(start_position):
                     total_attempts += result.get('attempts', 0)
-                    
+                    stats['attempts'] = total_attempts
+
                     # 如果找到密码
                     if result.get('password'):
                         found_password = result['password']
-                        
+
                         # 将密码保存到项目根目录
                         save_found_password(args.rar_file, found_password)
                         break
-                    
+
                     # 保存检查点
                     save_checkpoint(args.checkpoint, {
                         'position': result.get('position'),
                         'attempts': total_attempts
                     })
-                    
-                    # 更新进度显示
-                    current_time = time.time()
-                    if current_time - last_update >= args.update_interval:
-                        elapsed = current_time - start_time
-                        speed = total_attempts / elapsed if elapsed > 0 else 0
-                        
-                        # 更新进度条描述
-                        progress.update(
-                            task, 
-                            description=f"[cyan]正在破解密码... 速度: {format_speed(speed)}/秒 | 已尝试: {total_attempts:,} 组合[/cyan]"
-                        )
-                        last_update = current_time
-                        
+
             except Exception as e:
                 console.print(f"[bold red]破解过程中出错: {str(e)}[/bold red]")
                 traceback.print_exc()
+            finally:
+                stop_updater.set()
         
         # 显示结果
         console.print("\n" + "=" * 60)
@@ -198,6 +212,11 @@ def main():
         console.print(f"[bold red]程序错误: {str(e)}[/bold red]")
         traceback.print_exc()
     finally:
+        # 确保挂起的检查点落盘（保存是按间隔节流的）
+        try:
+            flush_checkpoint()
+        except Exception:
+            pass
         # 清理所有CUDA资源 (if any)
         if HAS_CUDA:
             try:
@@ -223,13 +242,23 @@ def save_found_password(rar_file, password):
         # 获取项目根目录
         root_dir = os.path.dirname(os.path.abspath(__file__))
         filepath = os.path.join(root_dir, filename)
-        
-        # 将密码写入文件
-        with open(filepath, 'w') as f:
-            f.write(f"RAR文件: {rar_file}\n")
-            f.write(f"破解时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"密码: {password}\n")
-        
+
+        # 单次写入+fsync+原子替换，崩溃时不会留下空文件或半截文件
+        payload = (
+            f"RAR文件: {rar_file}\n"
+            f"破解时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"密码: {password}\n"
+        ).encode('utf-8')
+
+        tmp_path = filepath + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, filepath)
+
         print(f"\n密码已保存到: {filepath}")
         return filepath
     except Exception as e:
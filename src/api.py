@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP API服务 (FastAPI)
+
+后端实例（对CUDA来说意味着上下文创建和核函数JIT编译，数百毫秒）
+在应用startup时构建一次，/crack请求复用这个温热的单例，而不是
+每个请求重新init。用 `uvicorn src.api:app` 启动。
+"""
+
+import os
+import uuid
+import tempfile
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from src.cracker import RARCracker
+from src import rar5_kdf
+from src.backends import get_backend
+from src.config import DEFAULT_CHARSET, MASK_SYMBOLS, PASSWORD_BATCH_SIZE
+from src.utils import (
+    parse_mask, positions_from_index_range, charset_to_array,
+    fill_candidate_matrix
+)
+
+logger = logging.getLogger(__name__)
+
+# 可选的orjson序列化：状态轮询这类高频小响应上，C实现的JSON
+# 比stdlib快数倍；没装orjson时退回默认的JSONResponse
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse
+    _app_kwargs = {'default_response_class': ORJSONResponse}
+except ImportError:
+    _app_kwargs = {}
+
+app = FastAPI(title='RapidRAR API', **_app_kwargs)
+
+# 进程级后端单例，startup时初始化，shutdown时清理
+_backend = None
+
+
+def _generate_batches(mask, charset, min_length, max_length,
+                      batch_size=PASSWORD_BATCH_SIZE):
+    """
+    按批生成候选密码，供同参数的请求组共享
+
+    同一窗口内参数相同的多个请求只需要扫一遍候选空间，
+    生成成本在K个档案之间摊销。
+    """
+    if mask:
+        charsets = parse_mask(mask, MASK_SYMBOLS)
+        charset_lengths = [len(c) if isinstance(c, str) and len(c) > 1 else 1
+                           for c in charsets]
+        total = 1
+        for l in charset_lengths:
+            total *= l
+        # 每个位置的字符查找表：位置矩阵直接按列做花式索引，
+        # 不再逐候选调get_position_from_index（每个候选n次divmod）
+        lookup = [charset_to_array(cs) for cs in charsets]
+        n = len(charsets)
+        for batch_start in range(0, total, batch_size):
+            count = min(batch_size, total - batch_start)
+            pos_matrix = positions_from_index_range(
+                batch_start, count, charset_lengths)
+            chars = np.empty((count, n), dtype=np.uint8)
+            for j in range(n):
+                chars[:, j] = lookup[j][pos_matrix[:, j]]
+            text = chars.tobytes().decode('ascii')
+            yield [text[k * n:(k + 1) * n] for k in range(count)]
+        return
+
+    charset_arr = charset_to_array(charset)
+    for length in range(min_length, max_length + 1):
+        total = len(charset) ** length
+        for batch_start in range(0, total, batch_size):
+            count = min(batch_size, total - batch_start)
+            matrix = np.empty((count, length), dtype=np.uint8)
+            fill_candidate_matrix(charset_arr, length, batch_start, matrix)
+            data = matrix.tobytes()
+            yield [data[k * length:(k + 1) * length].decode('ascii')
+                   for k in range(count)]
+
+
+class _CrackJob:
+    """一次/crack请求在合并器中的状态"""
+
+    def __init__(self, path, key, owns_path=False, header_only=False):
+        self.job_id = uuid.uuid4().hex
+        self.path = path
+        self.key = key
+        self.header_only = header_only
+        self.password = None
+        self.attempts = 0
+        self.status = 'queued'
+        self.done = threading.Event()
+        # 异步提交的任务拥有临时文件，完成后由合并器清理
+        self.owns_path = owns_path
+        # 完成时刻，注册表按TTL据此清退
+        self.finished_at = None
+
+
+class _CrackBatcher:
+    """
+    请求侧动态合并
+
+    并发到达的/crack请求先进入一个小窗口（默认20ms），窗口关闭后
+    按 (mask, charset, min_length, max_length) 分组，同组请求共享
+    一次候选空间扫描：每个批次生成一次，再逐档案检查。
+    """
+
+    WINDOW = 0.02
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._worker = None
+
+    def submit(self, path, mask, charset, min_length, max_length,
+               header_only=False):
+        job = self.submit_async(path, mask, charset, min_length, max_length,
+                                header_only=header_only)
+        job.done.wait()
+        return job
+
+    def submit_async(self, path, mask, charset, min_length, max_length,
+                     owns_path=False, header_only=False):
+        """入队后立即返回任务对象，调用方通过job.done/status跟踪"""
+        key = (mask, charset, min_length, max_length)
+        job = _CrackJob(path, key, owns_path=owns_path, header_only=header_only)
+        with self._lock:
+            self._pending.append(job)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        return job
+
+    def _run(self):
+        while True:
+            time.sleep(self.WINDOW)
+            with self._lock:
+                if not self._pending:
+                    # 摘掉线程引用必须和取队列在同一临界区：否则
+                    # submit_async看到is_alive()为真，而这里已经不会
+                    # 再取队列，新任务会被无限期搁置
+                    self._worker = None
+                    return
+                jobs, self._pending = self._pending, []
+            self._process(jobs)
+
+    def _process(self, jobs):
+        groups = {}
+        for job in jobs:
+            groups.setdefault(job.key, []).append(job)
+        for key, group in groups.items():
+            for job in group:
+                job.status = 'running'
+            try:
+                self._crack_group(key, group)
+                for job in group:
+                    job.status = 'done'
+            except Exception:
+                logger.exception("请求组破解失败")
+                for job in group:
+                    job.status = 'failed'
+            finally:
+                for job in group:
+                    if job.owns_path:
+                        try:
+                            os.unlink(job.path)
+                        except OSError:
+                            pass
+                    job.finished_at = time.monotonic()
+                    job.done.set()
+
+    def _crack_group(self, key, group):
+        mask, charset, min_length, max_length = key
+        if len(group) == 1:
+            # 单请求走完整的RARCracker路径（校验、候选确认等）
+            job = group[0]
+            cracker = RARCracker(job.path, mask=mask, charset=charset,
+                                 min_length=min_length, max_length=max_length,
+                                 backend_instance=_backend,
+                                 header_only=job.header_only)
+            for result in cracker.run():
+                job.attempts += result.get('attempts', 0)
+                if result.get('password'):
+                    job.password = result['password']
+                    return
+            return
+
+        # GPU后端的check_passwords按常量内存里的盐值/迭代次数/校验值
+        # 验证，不看rar_file参数——和RARCracker一样逐档案解析一次加密
+        # 头，检查某个任务的子批前先切换到它的参数，否则整组都在用
+        # 最后一次上传的参数验错档案
+        remaining = list(group)
+        job_enc = {}
+        job_header = {}
+        for job in remaining:
+            try:
+                job_enc[job.job_id] = rar5_kdf.parse_rar5_encryption(job.path)
+            except OSError:
+                job_enc[job.job_id] = None
+            with open(job.path, 'rb') as f:
+                job_header[job.job_id] = f.read(32)
+
+        def _activate(job):
+            enc = job_enc[job.job_id]
+            if enc and hasattr(_backend, 'set_encryption_params'):
+                _backend.set_encryption_params(
+                    enc['salt'], enc['iterations'], enc['check_value'])
+            if hasattr(_backend, 'set_rar_header'):
+                _backend.set_rar_header(job_header[job.job_id])
+
+        for batch in _generate_batches(mask, charset, min_length, max_length):
+            for job in list(remaining):
+                _activate(job)
+                found = _backend.check_passwords(batch, job.path)
+                job.attempts += len(batch)
+                if found:
+                    job.password = found
+                    remaining.remove(job)
+            if not remaining:
+                return
+
+
+_batcher = _CrackBatcher()
+
+# 异步任务注册表：job_id -> _CrackJob。破解会话可能长达数小时，
+# 同步持有HTTP连接既占用worker又容易超时，异步路径立即返回202
+# 让客户端轮询。完成的任务按TTL清退——不清退的话每次提交都在
+# 注册表里永久留一条（进行中的任务永不清退）。
+_jobs = {}
+_jobs_lock = threading.Lock()
+_JOB_TTL = 3600.0
+
+
+def _evict_jobs():
+    """清退完成超过TTL的任务（调用方不持有_jobs_lock）"""
+    cutoff = time.monotonic() - _JOB_TTL
+    with _jobs_lock:
+        expired = [job_id for job_id, job in _jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del _jobs[job_id]
+
+
+class CrackResponse(BaseModel):
+    password: Optional[str]
+    attempts: int
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    password: Optional[str] = None
+    attempts: int = 0
+
+
+@app.on_event('startup')
+def _init_backend():
+    global _backend
+    backend_name = os.environ.get('RAPIDRAR_BACKEND', 'auto')
+    gpu_id = int(os.environ.get('RAPIDRAR_GPU', '0'))
+    _backend = get_backend(backend_name, gpu_id=gpu_id)
+    _backend.init()
+    # 启动时预热调优缓存：此时还没有上传任何真实的KDF参数
+    # （d_kdf_iters为0，扫描走演示校验路径），几百毫秒完成；
+    # 留到首个请求时做，扫描就在全量PBKDF2上跑，要花几分钟
+    if hasattr(_backend, 'set_charset'):
+        _backend.set_charset(DEFAULT_CHARSET)
+    if hasattr(_backend, 'autotune'):
+        _backend.autotune(8)
+    logger.info("后端已初始化: %s", type(_backend).__name__)
+
+
+@app.on_event('shutdown')
+def _cleanup_backend():
+    global _backend
+    if _backend is not None:
+        _backend.cleanup()
+        _backend = None
+
+
+def _sendfile_all(dst_fd, src_fd, size):
+    """内核态sendfile循环，数据不经过Python缓冲区"""
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+
+# RAR5加密头在文件最前端；64KB前缀足够覆盖签名+加密块
+_HEADER_SCAN_LIMIT = 1 << 16
+
+
+async def _save_upload(file):
+    """上传内容写入临时文件
+
+    先读取头部前缀：RAR5头部加密的档案仅凭加密头（盐值/迭代
+    次数/校验值）即可验证密码，这种情况只落盘前缀并丢弃其余
+    字节——5GB的上传不再产生GB级磁盘写入。完整落盘路径上，
+    被starlette落盘的大文件走os.sendfile零拷贝，内存中的小
+    上传分块异步读取。
+
+    Returns:
+        (临时文件路径, header_only)
+    """
+    head = b''
+    while len(head) < _HEADER_SCAN_LIMIT:
+        chunk = await file.read(_HEADER_SCAN_LIMIT - len(head))
+        if not chunk:
+            break
+        head += chunk
+
+    enc = rar5_kdf.parse_rar5_encryption_bytes(head)
+    if enc and enc['check_value']:
+        with tempfile.NamedTemporaryFile(suffix='.rar', delete=False) as tmp:
+            tmp.write(head)
+        # 丢弃剩余字节，不写盘
+        while await file.read(1 << 20):
+            pass
+        return tmp.name, True
+
+    with tempfile.NamedTemporaryFile(suffix='.rar', delete=False) as tmp:
+        src = file.file
+        if hasattr(os, 'sendfile') and hasattr(src, 'fileno'):
+            try:
+                src_fd = src.fileno()
+            except (OSError, ValueError):
+                src_fd = None
+            if src_fd is not None:
+                # sendfile按显式偏移读取，前缀探测不影响它
+                size = os.fstat(src_fd).st_size
+                await run_in_threadpool(_sendfile_all, tmp.fileno(), src_fd, size)
+                return tmp.name, False
+        tmp.write(head)
+        while True:
+            chunk = await file.read(1 << 20)
+            if not chunk:
+                break
+            tmp.write(chunk)
+        return tmp.name, False
+
+
+@app.post('/crack', response_model=CrackResponse)
+async def crack(file: UploadFile = File(...),
+                mask: Optional[str] = Form(None),
+                charset: Optional[str] = Form(None),
+                min_length: int = Form(1),
+                max_length: int = Form(6)):
+    """上传RAR文件并尝试破解，复用进程级后端
+
+    破解在合并器的工作线程里进行；这里只通过run_in_threadpool
+    等待完成事件，事件循环保持可调度（/health、状态轮询等请求
+    不受长任务影响）。
+    """
+    tmp_path, header_only = await _save_upload(file)
+
+    try:
+        job = await run_in_threadpool(
+            _batcher.submit, tmp_path, mask, charset or DEFAULT_CHARSET,
+            min_length, max_length, header_only)
+    finally:
+        os.unlink(tmp_path)
+
+    return CrackResponse(password=job.password, attempts=job.attempts)
+
+
+@app.post('/crack/async', response_model=JobResponse, status_code=202)
+async def crack_async(file: UploadFile = File(...),
+                      mask: Optional[str] = Form(None),
+                      charset: Optional[str] = Form(None),
+                      min_length: int = Form(1),
+                      max_length: int = Form(6)):
+    """异步提交破解任务，立即返回job_id供轮询"""
+    tmp_path, header_only = await _save_upload(file)
+
+    _evict_jobs()
+    job = _batcher.submit_async(tmp_path, mask, charset or DEFAULT_CHARSET,
+                                min_length, max_length, owns_path=True,
+                                header_only=header_only)
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    return JobResponse(job_id=job.job_id, status=job.status)
+
+
+@app.get('/crack/{job_id}', response_model=JobResponse)
+def crack_status(job_id: str):
+    """查询异步破解任务状态"""
+    _evict_jobs()
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='任务不存在')
+    return JobResponse(job_id=job.job_id, status=job.status,
+                       password=job.password, attempts=job.attempts)
@@ -1,19 +1,25 @@
+import atexit
+
 from .cpu import CPUBackend
 
-def get_backend(backend_name='auto', **kwargs):
-    """
-    Factory to get the appropriate backend.
-    """
+# Backend cache keyed by (backend_name, gpu_id): CUDA context creation
+# and kernel JIT cost hundreds of ms, so repeated get_backend calls
+# (one per RARCracker without an injected backend) reuse one instance.
+_BACKENDS = {}
+
+
+def _create_backend(backend_name, **kwargs):
     if backend_name == 'cuda':
         try:
             from .cuda import CUDABackend
             return CUDABackend(**kwargs)
         except (ImportError, RuntimeError) as e:
             raise RuntimeError(f"Could not initialize CUDA backend: {e}")
-            
+
     elif backend_name == 'cpu':
-        return CPUBackend(**kwargs)
-        
+        # CPU backend only understands num_workers; drop GPU-only kwargs
+        return CPUBackend(num_workers=kwargs.get('num_workers'))
+
     elif backend_name == 'auto':
         # Try CUDA first
         try:
@@ -22,9 +28,35 @@ def get_backend(backend_name='auto', **kwargs):
                 return CUDABackend(**kwargs)
         except:
             pass
-            
+
         # Fallback to CPU
-        return CPUBackend(**kwargs)
-        
+        return CPUBackend(num_workers=kwargs.get('num_workers'))
+
     else:
         raise ValueError(f"Unknown backend: {backend_name}")
+
+
+def get_backend(backend_name='auto', **kwargs):
+    """
+    Factory to get the appropriate backend. Instances are cached per
+    (backend_name, gpu_id) and cleaned up at interpreter exit.
+    """
+    key = (backend_name, kwargs.get('gpu_id', 0))
+    backend = _BACKENDS.get(key)
+    if backend is None:
+        backend = _create_backend(backend_name, **kwargs)
+        _BACKENDS[key] = backend
+    return backend
+
+
+def cleanup_all():
+    """Release every cached backend (CUDA contexts, process pools)."""
+    while _BACKENDS:
+        _, backend = _BACKENDS.popitem()
+        try:
+            backend.cleanup()
+        except Exception:
+            pass
+
+
+atexit.register(cleanup_all)
@@ -1,30 +1,128 @@
 import os
 import concurrent.futures
+import multiprocessing
 import rarfile
 from .base import CrackerBackend
+from .. import unrar_native
+from .. import rar5_kdf
+
+# Cancellation event shared with the worker processes: once the main
+# process has a hit, in-flight chunks notice it and stop burning CPU on
+# candidates that no longer matter.
+_CANCEL_EVENT = None
+
+def _init_worker(cancel_event):
+    global _CANCEL_EVENT
+    _CANCEL_EVENT = cancel_event
+
+# Per-process cache of RAR5 encryption parameters (salt, iteration
+# count, password check value). Parsed once per worker; None when the
+# archive has no archive-level crypt header.
+_ENCRYPTION = {}
+
+def _get_encryption(rar_file):
+    if rar_file not in _ENCRYPTION:
+        try:
+            _ENCRYPTION[rar_file] = rar5_kdf.parse_rar5_encryption(rar_file)
+        except OSError:
+            _ENCRYPTION[rar_file] = None
+    return _ENCRYPTION[rar_file]
+
+# Per-process archive cache: RarFile construction parses the archive
+# header / central directory, which is far more expensive than a single
+# password try. Parse once per worker process and keep the handle plus
+# the first non-directory entry for the lifetime of the process.
+_ARCHIVE = {}
+
+def _get_archive(rar_file):
+    cached = _ARCHIVE.get(rar_file)
+    if cached is None:
+        rf = rarfile.RarFile(rar_file)
+        # One walk over the entries: prefer the smallest encrypted file,
+        # since the per-password cost scales with the bytes that must be
+        # decrypted and CRC-checked to accept or reject the candidate.
+        candidates = [f for f in rf.infolist() if not f.isdir()]
+        encrypted = [f for f in candidates if _needs_password(f)]
+        pool = encrypted or candidates
+        target = min(pool, key=lambda f: f.file_size or 0) if pool else None
+        cached = (rf, target)
+        _ARCHIVE[rar_file] = cached
+    return cached
+
+def _needs_password(info):
+    try:
+        return info.needs_password()
+    except AttributeError:
+        return False
 
 def check_password_worker(rar_file, password):
     """
     Worker function to check a single password.
     Must be at module level for multiprocessing pickling.
     """
+    # Header-only RAR5 path: compare against the crypt header's check
+    # value. Verification is pure PBKDF2 - no decompression, no file
+    # data touched at all.
+    enc = _get_encryption(rar_file)
+    if enc and enc['check_value']:
+        matched = rar5_kdf.verify_password(password, enc['salt'],
+                                           enc['iterations'],
+                                           enc['check_value'])
+        return password if matched else None
+    # In-process libunrar check: no fork/exec of the unrar binary per
+    # candidate, which rarfile would otherwise pay.
+    if unrar_native.is_available():
+        try:
+            return password if unrar_native.test_password(rar_file, password) else None
+        except Exception:
+            return None
     try:
-        rf = rarfile.RarFile(rar_file)
-        # Try to open the first file in the archive
-        # This is usually faster than extractall
-        for f in rf.infolist():
-            if f.isdir():
-                continue
-            with rf.open(f, pwd=password) as _:
-                # If we can read one byte, the password is likely correct
-                _.read(1)
-                return password
-        return None
+        # Only rf.open/read runs per password; parsing is cached.
+        rf, target = _get_archive(rar_file)
+        if target is None:
+            return None
+        with rf.open(target, pwd=password) as _:
+            # If we can read one byte, the password is likely correct
+            _.read(1)
+            return password
     except (rarfile.PasswordRequired, rarfile.BadRarFile, rarfile.RarCRCError):
         return None
     except Exception:
         return None
 
+def check_password_batch(rar_file, passwords):
+    """
+    Worker function to check a chunk of passwords in one process.
+    Must be at module level for multiprocessing pickling.
+    Returns the first matching password in the chunk, or None.
+    """
+    # Fastest path: PBKDF2 check-value comparison straight from the
+    # parsed crypt header. One hashlib.pbkdf2_hmac call per candidate
+    # (OpenSSL dispatches to SHA-NI at runtime), no archive I/O at all.
+    # The check value is only 64 bits; callers confirm hits with a full
+    # archive test, same as for GPU-reported candidates.
+    enc = _get_encryption(rar_file)
+    if enc and enc['check_value']:
+        for i, password in enumerate(passwords):
+            if _CANCEL_EVENT is not None and (i & 63) == 0 and _CANCEL_EVENT.is_set():
+                return None
+            if rar5_kdf.verify_password(password, enc['salt'],
+                                        enc['iterations'], enc['check_value']):
+                return password
+        return None
+    # Native path amortizes the library lookup over the whole chunk.
+    if unrar_native.is_available():
+        try:
+            return unrar_native.test_passwords(rar_file, passwords)
+        except Exception:
+            return None
+    for i, password in enumerate(passwords):
+        if _CANCEL_EVENT is not None and (i & 63) == 0 and _CANCEL_EVENT.is_set():
+            return None
+        if check_password_worker(rar_file, password):
+            return password
+    return None
+
 class CPUBackend(CrackerBackend):
     """
     CPU-based backend using multiprocessing.
@@ -33,7 +131,9 @@ class CPUBackend(CrackerBackend):
     def __init__(self, num_workers=None):
         self.num_workers = num_workers or os.cpu_count()
         self.pool = None
-        
+        self._manager = None
+        self._cancel = None
+
     def init(self):
         """Initialize the process pool."""
         # We create the pool lazily or here
@@ -44,19 +144,50 @@ class CPUBackend(CrackerBackend):
         Check a batch of passwords using multiprocessing.
         """
         if not self.pool:
-            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers)
-            
-        futures = []
-        for pwd in passwords:
-            futures.append(self.pool.submit(check_password_worker, rar_file, pwd))
-            
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result:
-                # Found a password! Cancel other futures if possible (though hard with processes)
-                # and return immediately
-                return result
-                
+            self._manager = multiprocessing.Manager()
+            self._cancel = self._manager.Event()
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                initializer=_init_worker, initargs=(self._cancel,))
+
+        if not passwords:
+            return None
+
+        # Hash-bound fast path: with a parsed check value every
+        # candidate is one pbkdf2_hmac call that releases the GIL, so a
+        # thread pool over OpenSSL's (SHA-NI dispatched) streams
+        # saturates all cores with zero pickle/IPC overhead.
+        enc = _get_encryption(rar_file)
+        if enc and enc['check_value']:
+            return rar5_kdf.verify_passwords(passwords, enc['salt'],
+                                             enc['iterations'],
+                                             enc['check_value'])
+
+        # Submit fixed-size chunks rather than one future per password:
+        # each pickle/IPC round-trip then amortizes over the whole chunk
+        # instead of being paid per candidate.
+        chunksize = max(1, len(passwords) // (self.num_workers * 4))
+        chunks = [passwords[i:i + chunksize]
+                  for i in range(0, len(passwords), chunksize)]
+        self._cancel.clear()
+        pending = {self.pool.submit(check_password_batch, rar_file, chunk)
+                   for chunk in chunks}
+
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result:
+                        # Tell in-flight workers to stop early
+                        self._cancel.set()
+                        return result
+        finally:
+            # Short-circuit: drop chunks that have not started yet
+            for future in pending:
+                future.cancel()
+
         return None
         
     def cleanup(self):
@@ -64,3 +195,7 @@ class CPUBackend(CrackerBackend):
         if self.pool:
             self.pool.shutdown()
             self.pool = None
+        if self._manager:
+            self._manager.shutdown()
+            self._manager = None
+            self._cancel = None
@@ -1,6 +1,7 @@
 import logging
 import numpy as np
 from .base import CrackerBackend
+from ..config import PASSWORD_BATCH_SIZE
 
 # Try to import GPUManager, but don't fail if pycuda is missing
 try:
@@ -11,91 +12,766 @@ try:
 except ImportError:
     HAS_CUDA = False
 
+# Stream capture / CUDA Graph support landed in pycuda after the minimum
+# version this project pins, so probe for it instead of assuming.
+HAS_CUDA_GRAPHS = HAS_CUDA and hasattr(cuda.Stream, 'begin_capture')
+
+logger = logging.getLogger(__name__)
+
 class CUDABackend(CrackerBackend):
     """
     CUDA-based backend for NVIDIA GPUs.
     """
     
-    def __init__(self, gpu_id=0, threads_per_block=256):
+    # Three slots so upload of batch N+1, compute of batch N and download
+    # of batch N-1 can all be in flight at once (triple buffering); two
+    # slots only ever overlap two of the three pipeline stages.
+    DEFAULT_NUM_STREAMS = 3
+
+    def __init__(self, gpu_id=0, threads_per_block=256,
+                 num_streams=DEFAULT_NUM_STREAMS):
         if not HAS_CUDA:
             raise RuntimeError("CUDA backend requires pycuda and an NVIDIA GPU.")
         self.gpu_id = gpu_id
         self.threads_per_block = threads_per_block
+        self.num_streams = max(1, num_streams)
         self.gpu_manager = None
         self.check_kernel = None
         self.rar_header = None
-        
+        self.mask_charsets = None
+        self.years = []
+        # Cached autotune result (tpb, batch); one sweep per backend
+        # lifetime, not one per cracker construction.
+        self._autotune_result = None
+        # One slot per stream, each with its own pinned staging buffers so
+        # slot N+1 can upload while slot N computes and slot N-1 downloads.
+        # Pageable host memory caps PCIe DMA at a fraction of the pinned
+        # bandwidth, so all staging goes through page-locked arrays.
+        self.streams = []
+        self._slots = []
+
     def init(self):
-        """Initialize CUDA context and kernels."""
+        """Initialize CUDA context and kernels. Safe to call repeatedly."""
+        if self.gpu_manager is not None:
+            return
         self.gpu_manager = GPUManager([self.gpu_id])
-        # We need to compile kernels. 
+        # GPUManager.__init__ only enumerates devices; the context is
+        # created here, before anything compiles or allocates against it.
+        self.gpu_manager.create_contexts()
         # Note: GPUManager._compile_kernels is internal, but we can use it or do it manually.
         # For simplicity, let's reuse GPUManager's context but compile our specific kernel here
         # or rely on what we had.
-        
-        # Actually, let's just use the raw pycuda logic similar to the original cracker.py
-        # to avoid complex dependency on the old GPUManager if we want to refactor it out later.
-        # But for now, reusing GPUManager is easier.
-        
         self.gpu_manager._compile_kernels(self.gpu_id)
         self.check_kernel = self.gpu_manager.functions[self.gpu_id]['check_rar_password']
-        
+        self.streams = [self.gpu_manager.create_stream(self.gpu_id)
+                        for _ in range(self.num_streams)]
+        self._slots = [{'chars': None, 'offsets': None, 'results': None,
+                        'd_chars': None, 'd_offsets': None, 'd_results': None,
+                        'd_keys': None,
+                        'char_capacity': 0, 'batch_capacity': 0,
+                        'graph_exec': None, 'graph_key': None, 'warm_key': None}
+                       for _ in range(self.num_streams)]
+        # Events linking the PBKDF2 stage to the verify stage across streams
+        with self.gpu_manager.activate(self.gpu_id):
+            self.stage_events = [cuda.Event() for _ in range(self.num_streams)]
+
+        # Pre-size every slot for the default batch split so early batches
+        # run at steady state instead of growing buffers (and invalidating
+        # captured graphs) mid-session. Sized for 32-char candidates, the
+        # kernel-side maximum.
+        per_slot = PASSWORD_BATCH_SIZE // self.num_streams + 1
+        for slot in self._slots:
+            self._ensure_staging(slot, per_slot, per_slot * 32)
+            # 8-byte hit word per slot: the kernels report the first
+            # matching linear index via atomicCAS against the sentinel,
+            # so a no-hit batch downloads 8 bytes instead of a bitmap.
+            slot['hit'] = self.gpu_manager.allocate_pinned(
+                self.gpu_id, (1,), dtype=np.uint64)
+            slot['sentinel'] = self.gpu_manager.allocate_pinned(
+                self.gpu_id, (1,), dtype=np.uint64, write_combined=True)
+            slot['sentinel'][:] = np.uint64(0xFFFFFFFFFFFFFFFF)
+            slot['d_hit'] = self.gpu_manager.allocate_memory(self.gpu_id, 8)
+
+    def _ensure_staging(self, slot, num_passwords, total_chars):
+        """
+        (Re)allocate a slot's pinned host staging buffers if the current
+        sub-batch does not fit. Buffers only grow, so steady-state batches
+        reuse the same page-locked memory on every call.
+        """
+        if total_chars > slot['char_capacity']:
+            slot['chars'] = self.gpu_manager.allocate_pinned(
+                self.gpu_id, (total_chars,), dtype=np.uint8, write_combined=True)
+            slot['d_chars'] = self.gpu_manager.allocate_memory(self.gpu_id, total_chars)
+            slot['char_capacity'] = total_chars
+            self._invalidate_graph(slot)
+        if num_passwords > slot['batch_capacity']:
+            # Offsets are a prefix sum over the candidate lengths, so the
+            # buffer holds one extra element.
+            slot['offsets'] = self.gpu_manager.allocate_pinned(
+                self.gpu_id, (num_passwords + 1,), dtype=np.int32, write_combined=True)
+            # Results come back D2H, so no write-combining here. One byte
+            # per candidate: only 0/1 is ever written, and uint8 cuts the
+            # per-batch result download to a quarter of the int32 size.
+            slot['results'] = self.gpu_manager.allocate_pinned(
+                self.gpu_id, (num_passwords,), dtype=np.uint8)
+            slot['d_offsets'] = self.gpu_manager.allocate_memory(
+                self.gpu_id, (num_passwords + 1) * 4)
+            slot['d_results'] = self.gpu_manager.allocate_memory(self.gpu_id, num_passwords)
+            # Derived keys handed from the PBKDF2 stage to the verify stage
+            slot['d_keys'] = self.gpu_manager.allocate_memory(self.gpu_id, num_passwords * 32)
+            slot['batch_capacity'] = num_passwords
+            self._invalidate_graph(slot)
+
+    def reserve(self, batch_size, max_length=32):
+        """
+        Grow every slot's staging buffers for the final batch size once.
+
+        Called by the cracker after autotuning settles on a batch size
+        that may exceed the default pre-sizing, so the hot loop never
+        triggers a growth reallocation (which would also invalidate any
+        captured CUDA Graph).
+        """
+        per_slot = batch_size // self.num_streams + 1
+        for slot in self._slots:
+            self._ensure_staging(slot, per_slot, per_slot * min(max_length, 32))
+
+    @staticmethod
+    def _invalidate_graph(slot):
+        """Drop a slot's captured graph after any buffer pointer changed."""
+        slot['graph_exec'] = None
+        slot['graph_key'] = None
+        slot['warm_key'] = None
+
     def set_rar_header(self, rar_header):
-        """Set the RAR header data for checking."""
+        """
+        Upload the RAR header to __constant__ memory once.
+
+        The header is immutable per archive, so it lives in the constant
+        cache (warp-broadcast reads) instead of being passed to every
+        kernel launch as a global-memory pointer.
+        """
         self.rar_header = rar_header
-        
-    def check_passwords(self, passwords, rar_file):
+        data = rar_header[:64]
+        module = self.gpu_manager.modules[self.gpu_id]['rar_check']
+        with self.gpu_manager.activate(self.gpu_id):
+            ptr, _ = module.get_global('g_header')
+            cuda.memcpy_htod(ptr, np.frombuffer(data, dtype=np.uint8))
+            ptr, _ = module.get_global('g_header_len')
+            cuda.memcpy_htod(ptr, np.array([len(data)], dtype=np.int32))
+
+    # 自动调优扫描的候选配置
+    TPB_CANDIDATES = (64, 128, 192, 256, 384, 512, 768, 1024)
+    BATCH_CANDIDATES = (1 << 18, 1 << 20, 1 << 22)
+
+    def autotune(self, length):
         """
-        Check a batch of passwords on GPU.
+        Micro-benchmark threads_per_block and batch size at startup.
+
+        Optimal occupancy depends on the register pressure of the check
+        kernel and cannot be derived statically, so sweep a handful of
+        block sizes (and then batch sizes, clipped to available VRAM)
+        with cuda.Event timings of the indexed kernel and keep the
+        fastest. Costs a few hundred ms once per backend lifetime: the
+        result is cached, so a warm shared backend (the API singleton)
+        does not re-run the sweep — with real KDF parameters uploaded
+        that would mean full PBKDF2 over millions of candidates on
+        every request.
+
+        Args:
+            length: representative password length for the benchmark
+
+        Returns:
+            int or None: recommended batch size, or None if tuning was
+            not possible (e.g. no charset uploaded yet).
+        """
+        if self._autotune_result is not None:
+            self.threads_per_block = self._autotune_result[0]
+            return self._autotune_result[1]
+        if not getattr(self, 'charset', None):
+            return None
+
+        charset_len = len(self.charset)
+        max_threads, _ = self.gpu_manager._launch_limits[self.gpu_id]
+        max_batch = self.gpu_manager.get_optimal_batch_size(self.gpu_id, max(length, 32) + 8)
+
+        slot = self._slots[0]
+        sample = 1 << 16
+        self._ensure_staging(slot, sample, 0)
+
+        with self.gpu_manager.activate(self.gpu_id):
+            def time_launch(tpb, count):
+                # 必须走execute_kernel：生产路径的网格/块配置都由它
+                # 决定，调优自己拼网格测出来的是另一条启动路径的
+                # 行为，推荐值在生产中无法复现
+                args = (np.uint64(0), np.uint32(count), np.uint32(charset_len),
+                        np.uint32(length), slot['d_results'])
+                def launch():
+                    self.gpu_manager.execute_kernel(
+                        self.gpu_id, 'check_rar_password_indexed', *args,
+                        num_items=count, threads_per_block=tpb)
+                # 热身一次，排除首次启动的开销
+                launch()
+                start, end = cuda.Event(), cuda.Event()
+                start.record()
+                launch()
+                end.record()
+                end.synchronize()
+                return end.time_since(start)
+
+            best_tpb, best_time = self.threads_per_block, None
+            for tpb in self.TPB_CANDIDATES:
+                if tpb > max_threads:
+                    continue
+                elapsed = time_launch(tpb, sample)
+                if best_time is None or elapsed < best_time:
+                    best_tpb, best_time = tpb, elapsed
+            self.threads_per_block = best_tpb
+
+            best_batch, best_rate = None, 0.0
+            for batch in self.BATCH_CANDIDATES:
+                if batch > max_batch:
+                    continue
+                self._ensure_staging(slot, batch, 0)
+                elapsed = time_launch(best_tpb, batch)
+                rate = batch / elapsed if elapsed > 0 else 0.0
+                if rate > best_rate:
+                    best_batch, best_rate = batch, rate
+
+            if best_batch is None:
+                best_batch = min(self.BATCH_CANDIDATES[0], max_batch)
+            logger.info("自动调优: threads_per_block=%d batch_size=%d",
+                        best_tpb, best_batch)
+            self._autotune_result = (best_tpb, best_batch)
+            return best_batch
+
+    def set_charset(self, charset):
+        """Upload the brute-force charset to __constant__ memory once."""
+        self.charset = charset
+        data = np.frombuffer(charset.encode('ascii'), dtype=np.uint8)
+        module = self.gpu_manager.modules[self.gpu_id]['rar_check']
+        with self.gpu_manager.activate(self.gpu_id):
+            ptr, _ = module.get_global('c_charset')
+            cuda.memcpy_htod(ptr, data)
+
+    # Row stride of the per-position mask tables in __constant__ memory;
+    # must match MASK_ROW_STRIDE in the kernel source.
+    MASK_ROW_STRIDE = 96
+    MASK_MAX_POSITIONS = 32
+
+    def set_mask(self, charsets):
+        """Upload the per-position mask charsets to __constant__ memory.
+
+        One row per mask position (row stride fits ?a, the largest
+        symbol class). After this single upload the whole mask space is
+        generated on-device by mixed-radix decomposition; each batch
+        ships only (start_idx, count) up and the 8-byte hit word down.
+        """
+        if len(charsets) > self.MASK_MAX_POSITIONS:
+            raise ValueError(
+                f"mask has {len(charsets)} positions, "
+                f"device tables hold at most {self.MASK_MAX_POSITIONS}")
+        self.mask_charsets = list(charsets)
+        tables = np.zeros(
+            self.MASK_MAX_POSITIONS * self.MASK_ROW_STRIDE, dtype=np.uint8)
+        lens = np.ones(self.MASK_MAX_POSITIONS, dtype=np.int32)
+        for pos, cs in enumerate(charsets):
+            row = np.frombuffer(cs.encode('ascii'), dtype=np.uint8)
+            tables[pos * self.MASK_ROW_STRIDE:
+                   pos * self.MASK_ROW_STRIDE + row.size] = row
+            lens[pos] = row.size
+        module = self.gpu_manager.modules[self.gpu_id]['rar_check']
+        with self.gpu_manager.activate(self.gpu_id):
+            ptr, _ = module.get_global('c_mask_tables')
+            cuda.memcpy_htod(ptr, tables)
+            ptr, _ = module.get_global('c_mask_lens')
+            cuda.memcpy_htod(ptr, lens)
+
+    def check_mask_range(self, start_idx, count):
+        """
+        Check a contiguous index range of mask candidates.
+
+        Same shape as check_password_range but decomposing against the
+        per-position tables uploaded by set_mask. The decomposition
+        order matches the host's get_position_from_index (last position
+        is the least significant digit), so a hit index reconstructs
+        with the same logic.
+
+        Returns:
+            str or None: the matching password, or None.
+        """
+        num_positions = len(self.mask_charsets)
+        per_slot = (count + self.num_streams - 1) // self.num_streams
+        pending = []
+
+        for slot_idx in range(self.num_streams):
+            sub_start = start_idx + slot_idx * per_slot
+            sub_count = min(per_slot, start_idx + count - sub_start)
+            if sub_count <= 0:
+                break
+            slot = self._slots[slot_idx]
+            stream = self.streams[slot_idx]
+
+            self.gpu_manager.copy_to_device_async(
+                self.gpu_id, slot['sentinel'], slot['d_hit'], stream)
+            self.gpu_manager.execute_kernel(
+                self.gpu_id, 'mask_brute_range',
+                np.uint64(sub_start), np.uint32(sub_count),
+                np.uint32(num_positions), slot['d_hit'],
+                num_items=sub_count,
+                threads_per_block=self.threads_per_block,
+                stream=stream
+            )
+            self.gpu_manager.copy_from_device_async(
+                self.gpu_id, slot['d_hit'], slot['hit'], stream)
+            pending.append((slot_idx, stream))
+
+        for slot_idx, sync_stream in pending:
+            with self.gpu_manager.activate(self.gpu_id):
+                sync_stream.synchronize()
+            hit = int(self._slots[slot_idx]['hit'][0])
+            if hit != 0xFFFFFFFFFFFFFFFF:
+                chars = [''] * num_positions
+                for pos in range(num_positions - 1, -1, -1):
+                    cs = self.mask_charsets[pos]
+                    chars[pos] = cs[hit % len(cs)]
+                    hit //= len(cs)
+                return ''.join(chars)
+
+        return None
+
+    def set_years(self, years):
+        """Upload the year-suffix table (4 ASCII digits per row) once.
+
+        After this the kernel synthesizes pw||year variants from the
+        base wordlist in registers; only the base words cross PCIe.
+        """
+        self.years = [str(y) for y in years]
+        data = np.frombuffer(''.join(self.years).encode('ascii'),
+                             dtype=np.uint8)
+        module = self.gpu_manager.modules[self.gpu_id]['rar_check']
+        with self.gpu_manager.activate(self.gpu_id):
+            ptr, _ = module.get_global('c_years')
+            cuda.memcpy_htod(ptr, data)
+
+    def check_passwords_with_years(self, passwords):
+        """
+        Check each password plus its year-suffixed variants.
+
+        Thread t maps to (base word t // (n+1), variant t % (n+1)); the
+        variants never exist on the host, so PCIe traffic and staging
+        stay at base-wordlist size while the grid covers the expanded
+        space.
+
+        Returns:
+            str or None: the matching (possibly suffixed) password.
         """
         if not passwords:
             return None
-            
-        # Prepare data
-        password_data = ''.join(passwords)
-        password_lengths = [len(p) for p in passwords]
+        num_years = len(self.years)
+        factor = num_years + 1
         num_passwords = len(passwords)
-        
-        # Allocate memory
-        passwords_gpu = self.gpu_manager.allocate_memory(self.gpu_id, len(password_data))
-        lengths_gpu = self.gpu_manager.allocate_memory(self.gpu_id, len(password_lengths) * 4)
-        results_gpu = self.gpu_manager.allocate_memory(self.gpu_id, num_passwords * 4)
-        
-        # We also need header gpu if we haven't allocated it yet, or allocate per batch
-        # For simplicity, allocate per batch
-        header_gpu = self.gpu_manager.allocate_memory(self.gpu_id, len(self.rar_header))
-        
-        try:
-            # Copy data
-            self.gpu_manager.copy_to_device(self.gpu_id, np.array([ord(c) for c in password_data], dtype=np.uint8), passwords_gpu)
-            self.gpu_manager.copy_to_device(self.gpu_id, np.array(password_lengths, dtype=np.int32), lengths_gpu)
-            self.gpu_manager.copy_to_device(self.gpu_id, np.array([b for b in self.rar_header], dtype=np.uint8), header_gpu)
-            
-            # Execute kernel
+        per_slot = (num_passwords + self.num_streams - 1) // self.num_streams
+        pending = []
+
+        for slot_idx in range(self.num_streams):
+            sub = passwords[slot_idx * per_slot:(slot_idx + 1) * per_slot]
+            if not sub:
+                break
+            slot = self._slots[slot_idx]
+            stream = self.streams[slot_idx]
+
+            # errors='replace': a UTF-8 wordlist can hold words outside
+            # latin-1, and one such word must not abort the whole batch.
+            # Each unencodable char becomes one '?' byte, so the offsets
+            # built from str lengths below stay aligned; the replaced
+            # candidates just become harmless mismatches (they can't be
+            # represented in the kernel's byte model anyway).
+            password_data = ''.join(sub).encode('latin-1', 'replace')
+            sub_count = len(sub)
+            total_chars = len(password_data)
+            expanded = sub_count * factor
+
+            # Results must cover the expanded grid, offsets only the
+            # base words; sizing staging for the expanded count covers
+            # both.
+            self._ensure_staging(slot, expanded, total_chars)
+            slot['chars'][:total_chars] = np.frombuffer(password_data,
+                                                        dtype=np.uint8)
+            offsets = slot['offsets'][:sub_count + 1]
+            offsets[0] = 0
+            np.cumsum(np.fromiter(map(len, sub), dtype=np.int32,
+                                  count=sub_count),
+                      out=offsets[1:])
+
+            self.gpu_manager.copy_to_device_async(
+                self.gpu_id, slot['chars'][:total_chars], slot['d_chars'], stream)
+            self.gpu_manager.copy_to_device_async(
+                self.gpu_id, slot['offsets'][:sub_count + 1], slot['d_offsets'], stream)
             self.gpu_manager.execute_kernel(
-                self.gpu_id, 'check_rar_password',
-                passwords_gpu, lengths_gpu, np.int32(num_passwords),
-                header_gpu, np.int32(len(self.rar_header)),
-                results_gpu,
-                num_items=num_passwords
+                self.gpu_id, 'check_rar_password_years',
+                slot['d_chars'], slot['d_offsets'], np.int32(sub_count),
+                np.int32(num_years), slot['d_results'],
+                num_items=expanded,
+                threads_per_block=self.threads_per_block,
+                stream=stream
             )
+            self.gpu_manager.copy_from_device_async(
+                self.gpu_id, slot['d_results'], slot['results'][:expanded], stream)
+            pending.append((slot_idx, sub, expanded))
+
+        for slot_idx, sub, expanded in pending:
+            with self.gpu_manager.activate(self.gpu_id):
+                self.streams[slot_idx].synchronize()
+            results = self._slots[slot_idx]['results'][:expanded]
+            hits = np.flatnonzero(results == 1)
+            if hits.size:
+                hit = int(hits[0])
+                base = sub[hit // factor]
+                v = hit % factor
+                return base if v == 0 else base + self.years[v - 1]
+
+        return None
+
+    def check_password_range(self, start_idx, count, length):
+        """
+        Check a contiguous index range of brute-force candidates.
+
+        Candidates are pure functions of their 64-bit linear index and the
+        charset, so they are generated inside the kernel from __constant__
+        memory. Each batch ships three scalars up and an 8-byte hit word
+        down - no candidate bytes ever cross PCIe.
+
+        Returns:
+            str or None: the matching password, or None.
+        """
+        charset_len = len(self.charset)
+        per_slot = (count + self.num_streams - 1) // self.num_streams
+        # Two-stage pipeline needs a second stream for the verify stage
+        staged = self.num_streams >= 2
+        pending = []
+
+        for slot_idx in range(self.num_streams):
+            sub_start = start_idx + slot_idx * per_slot
+            sub_count = min(per_slot, start_idx + count - sub_start)
+            if sub_count <= 0:
+                break
+            slot = self._slots[slot_idx]
+            stream = self.streams[slot_idx]
+            self._ensure_staging(slot, sub_count, 0)
+
+            # Reset the hit word to the sentinel before launching
+            self.gpu_manager.copy_to_device_async(
+                self.gpu_id, slot['sentinel'], slot['d_hit'], stream)
+
+            if staged:
+                # Stage A (PBKDF2, the dominant cost) on this slot's
+                # stream; stage B (check-value verify) on the next
+                # stream, linked by an event. Stage B of this batch then
+                # overlaps stage A of the next one, and each stage keeps
+                # its own register/occupancy profile.
+                verify_stream = self.streams[(slot_idx + 1) % self.num_streams]
+                self.gpu_manager.execute_kernel(
+                    self.gpu_id, 'pbkdf2_stage',
+                    np.uint64(sub_start), np.uint32(sub_count),
+                    np.uint32(charset_len), np.uint32(length),
+                    slot['d_keys'],
+                    num_items=sub_count,
+                    threads_per_block=self.threads_per_block,
+                    stream=stream
+                )
+                event = self.stage_events[slot_idx]
+                with self.gpu_manager.activate(self.gpu_id):
+                    event.record(stream)
+                    verify_stream.wait_for_event(event)
+                self.gpu_manager.execute_kernel(
+                    self.gpu_id, 'verify_stage',
+                    slot['d_keys'], np.uint64(sub_start), np.uint32(sub_count),
+                    slot['d_hit'],
+                    num_items=sub_count,
+                    threads_per_block=self.threads_per_block,
+                    stream=verify_stream
+                )
+                sync_stream = verify_stream
+            else:
+                # Fused single-stream path: generation + KDF + verify in
+                # one launch, hit reported through the same 8-byte word.
+                self.gpu_manager.execute_kernel(
+                    self.gpu_id, 'brute_range',
+                    np.uint64(sub_start), np.uint32(sub_count),
+                    np.uint32(charset_len), np.uint32(length),
+                    slot['d_hit'],
+                    num_items=sub_count,
+                    threads_per_block=self.threads_per_block,
+                    stream=stream
+                )
+                sync_stream = stream
+            self.gpu_manager.copy_from_device_async(
+                self.gpu_id, slot['d_hit'], slot['hit'], sync_stream)
+            pending.append((slot_idx, sync_stream))
+
+        for slot_idx, sync_stream in pending:
+            with self.gpu_manager.activate(self.gpu_id):
+                sync_stream.synchronize()
+            hit = int(self._slots[slot_idx]['hit'][0])
+            if hit != 0xFFFFFFFFFFFFFFFF:
+                # Reconstruct the password from its linear index
+                chars = []
+                for _ in range(length):
+                    chars.append(self.charset[hit % charset_len])
+                    hit //= charset_len
+                return ''.join(reversed(chars))
+
+        return None
+
+    def set_encryption_params(self, salt, iterations, check_value=b''):
+        """
+        Upload the RAR5 key-derivation parameters to __constant__ memory.
+
+        Parsed once at cracker init; kernels read them from the constant
+        cache instead of receiving them as per-batch arguments.
+        """
+        module = self.gpu_manager.modules[self.gpu_id]['rar_check']
+        with self.gpu_manager.activate(self.gpu_id):
+            ptr, _ = module.get_global('d_salt')
+            cuda.memcpy_htod(ptr, np.frombuffer(salt[:16].ljust(16, b'\0'), dtype=np.uint8))
+            ptr, _ = module.get_global('d_kdf_iters')
+            cuda.memcpy_htod(ptr, np.array([iterations], dtype=np.uint32))
+            if check_value:
+                ptr, _ = module.get_global('d_check')
+                cuda.memcpy_htod(ptr, np.frombuffer(check_value[:12].ljust(12, b'\0'), dtype=np.uint8))
+
+    def check_passwords_matrix(self, matrix):
+        """
+        Check a batch of equal-length candidates given as a (count, length)
+        uint8 matrix.
+
+        The pinned staging buffer is filled in transposed (SoA) order, so
+        on the device char j of all candidates is contiguous and a warp's
+        loads coalesce into single cache lines instead of strided 1-byte
+        accesses.
+
+        Returns:
+            str or None: the matching password, or None.
+        """
+        count, length = matrix.shape
+        per_slot = (count + self.num_streams - 1) // self.num_streams
+        pending = []
+
+        for slot_idx in range(self.num_streams):
+            sub = matrix[slot_idx * per_slot:(slot_idx + 1) * per_slot]
+            sub_count = sub.shape[0]
+            if sub_count == 0:
+                break
+            slot = self._slots[slot_idx]
+            stream = self.streams[slot_idx]
+            total_chars = sub_count * length
+            self._ensure_staging(slot, sub_count, total_chars)
+
+            # Transpose into the pinned buffer: column-major on the device
+            slot['chars'][:total_chars].reshape(length, sub_count)[:] = sub.T
+
+            def issue(slot=slot, stream=stream, sub_count=sub_count,
+                      total_chars=total_chars, length=length):
+                self.gpu_manager.copy_to_device_async(
+                    self.gpu_id, slot['chars'][:total_chars], slot['d_chars'], stream)
+                self.gpu_manager.execute_kernel(
+                    self.gpu_id, 'check_rar_password_soa',
+                    slot['d_chars'], np.int32(length), np.int32(sub_count),
+                    slot['d_results'],
+                    num_items=sub_count,
+                    threads_per_block=self.threads_per_block,
+                    stream=stream
+                )
+                self.gpu_manager.copy_from_device_async(
+                    self.gpu_id, slot['d_results'], slot['results'][:sub_count], stream)
+
+            self._dispatch_captured(
+                slot_idx, ('soa', sub_count, length), issue)
+            pending.append((slot_idx, slot_idx * per_slot, sub_count))
+
+        for slot_idx, offset, sub_count in pending:
+            with self.gpu_manager.activate(self.gpu_id):
+                self.streams[slot_idx].synchronize()
+            results = self._slots[slot_idx]['results'][:sub_count]
+            hits = np.flatnonzero(results == 1)
+            if hits.size:
+                return matrix[offset + int(hits[0])].tobytes().decode('ascii')
+
+        return None
+
+    def _issue_slot(self, slot_idx, sub_count, total_chars):
+        """Issue the H2D copies, kernel and D2H copy for one slot's stream."""
+        slot = self._slots[slot_idx]
+        stream = self.streams[slot_idx]
+        self.gpu_manager.copy_to_device_async(self.gpu_id, slot['chars'][:total_chars], slot['d_chars'], stream)
+        self.gpu_manager.copy_to_device_async(self.gpu_id, slot['offsets'][:sub_count + 1], slot['d_offsets'], stream)
+        self.gpu_manager.execute_kernel(
+            self.gpu_id, 'check_rar_password',
+            slot['d_chars'], slot['d_offsets'], np.int32(sub_count),
+            slot['d_results'],
+            num_items=sub_count,
+            threads_per_block=self.threads_per_block,
+            stream=stream
+        )
+        self.gpu_manager.copy_from_device_async(self.gpu_id, slot['d_results'], slot['results'][:sub_count], stream)
+
+    def _dispatch_captured(self, slot_idx, key, issue):
+        """
+        Run one slot's pipeline step, replaying a captured CUDA Graph when
+        the batch geometry is stable. The H2D + kernel + D2H triple then
+        costs a single graph launch instead of three driver calls, which
+        matters at millions of batches per session. The first time a
+        geometry is seen the work is issued normally (warm-up); the second
+        time it is captured and instantiated; afterwards it is replayed
+        until a buffer reallocation or geometry change invalidates it.
+
+        Args:
+            slot_idx: stream slot to run on
+            key: hashable batch-geometry key; a change invalidates capture
+            issue: zero-argument callable issuing the slot's async work
+        """
+        slot = self._slots[slot_idx]
+        stream = self.streams[slot_idx]
+
+        if slot['graph_exec'] is not None and slot['graph_key'] == key:
+            with self.gpu_manager.activate(self.gpu_id):
+                slot['graph_exec'].launch(stream)
+            return
+
+        if HAS_CUDA_GRAPHS and slot['warm_key'] == key:
+            with self.gpu_manager.activate(self.gpu_id):
+                stream.begin_capture()
+                issue()
+                graph = stream.end_capture()
+                slot['graph_exec'] = graph.instantiate()
+                slot['graph_key'] = key
+                # Capture only records the work; replay it for this batch.
+                slot['graph_exec'].launch(stream)
+            return
+
+        issue()
+        slot['warm_key'] = key
+
+    def _dispatch_slot(self, slot_idx, sub_count, total_chars):
+        """Dispatch one AoS (variable-length) slot, graph-captured."""
+        self._dispatch_captured(
+            slot_idx, ('aos', sub_count, total_chars),
+            lambda: self._issue_slot(slot_idx, sub_count, total_chars))
+
+    def check_passwords_packed(self, chars, offsets):
+        """
+        Check a batch given as packed uint8 chars plus int32 offsets.
+
+        Byte-level twin of check_passwords for callers that already hold
+        the candidate bytes (an mmap'ed wordlist, say): the batch is
+        copied straight into pinned staging and no Python str objects
+        are ever created for it. offsets has count+1 entries with
+        offsets[0] == 0.
+
+        Returns:
+            int or None: index of the first matching candidate, or None.
+        """
+        count = offsets.shape[0] - 1
+        if count <= 0:
+            return None
+        per_slot = (count + self.num_streams - 1) // self.num_streams
+        pending = []
+
+        for slot_idx in range(self.num_streams):
+            lo = slot_idx * per_slot
+            hi = min(count, lo + per_slot)
+            if hi <= lo:
+                break
+            slot = self._slots[slot_idx]
+            sub_count = hi - lo
+            char_lo = int(offsets[lo])
+            char_hi = int(offsets[hi])
+            total_chars = char_hi - char_lo
+
+            self._ensure_staging(slot, sub_count, total_chars)
+            slot['chars'][:total_chars] = chars[char_lo:char_hi]
+            slot['offsets'][:sub_count + 1] = offsets[lo:hi + 1] - char_lo
+            pending.append((slot_idx, lo, sub_count, total_chars))
+
+        for slot_idx, lo, sub_count, total_chars in pending:
+            self._dispatch_slot(slot_idx, sub_count, total_chars)
+
+        for slot_idx, lo, sub_count, total_chars in pending:
+            with self.gpu_manager.activate(self.gpu_id):
+                self.streams[slot_idx].synchronize()
+            results = self._slots[slot_idx]['results'][:sub_count]
+            hits = np.flatnonzero(results == 1)
+            if hits.size:
+                return lo + int(hits[0])
+
+        return None
+
+    def check_passwords(self, passwords, rar_file):
+        """
+        Check a batch of passwords on GPU.
+        """
+        if not passwords:
+            return None
             
-            # Get results
-            results = np.zeros(num_passwords, dtype=np.int32)
-            self.gpu_manager.copy_from_device(self.gpu_id, results_gpu, results)
-            
-            # Check results
-            for i, res in enumerate(results):
-                if res == 1:
-                    return passwords[i]
-                    
-        finally:
-            # Free memory (pycuda handles this via refcounting usually, but explicit free is good if using raw pointers)
-            # GPUManager doesn't expose free easily, but pycuda objects do.
-            pass
-            
+        # Split the batch across the stream slots so H2D, kernel and D2H of
+        # different sub-batches overlap on the copy and compute engines.
+        num_passwords = len(passwords)
+        per_slot = (num_passwords + self.num_streams - 1) // self.num_streams
+        pending = []
+
+        for slot_idx in range(self.num_streams):
+            sub = passwords[slot_idx * per_slot:(slot_idx + 1) * per_slot]
+            if not sub:
+                break
+            slot = self._slots[slot_idx]
+
+            # Prepare data: one join + encode keeps the per-char work in
+            # C (memcpy), instead of O(N*L) Python bytecode per batch.
+            # errors='replace' keeps non-latin-1 dictionary words from
+            # aborting the batch; one '?' byte per unencodable char
+            # preserves the length-based offsets below.
+            password_data = ''.join(sub).encode('latin-1', 'replace')
+            sub_count = len(sub)
+            total_chars = len(password_data)
+
+            # Fill the reusable pinned staging buffers in place
+            self._ensure_staging(slot, sub_count, total_chars)
+            slot['chars'][:total_chars] = np.frombuffer(password_data, dtype=np.uint8)
+            offsets = slot['offsets'][:sub_count + 1]
+            offsets[0] = 0
+            np.cumsum(np.fromiter(map(len, sub), dtype=np.int32, count=sub_count),
+                      out=offsets[1:])
+
+            pending.append((slot_idx, sub, sub_count, total_chars))
+
+        # Dispatch every slot before draining any, so one slot's upload runs
+        # under another slot's compute.
+        for slot_idx, sub, sub_count, total_chars in pending:
+            self._dispatch_slot(slot_idx, sub_count, total_chars)
+
+        # Drain the slots in order and scan for a hit
+        for slot_idx, sub, sub_count, total_chars in pending:
+            with self.gpu_manager.activate(self.gpu_id):
+                self.streams[slot_idx].synchronize()
+            results = self._slots[slot_idx]['results'][:sub_count]
+            # Single C pass over the results; the Python loop only ever
+            # runs over the (near-zero) hits.
+            hits = np.flatnonzero(results == 1)
+            if hits.size:
+                return sub[int(hits[0])]
+
         return None
         
     def cleanup(self):
         if self.gpu_manager:
             self.gpu_manager.cleanup()
+        # Drop everything tied to the destroyed contexts, and gpu_manager
+        # itself last: init() treats a non-None manager as "already
+        # initialized", so leaving it set would turn a later init() into a
+        # no-op over freed contexts.
+        self.check_kernel = None
+        self.streams = []
+        self._slots = []
+        self.stage_events = []
+        self._autotune_result = None
+        self.gpu_manager = None
@@ -14,6 +14,15 @@ SPECIAL_CHARS = "@#!$%^"
 DEFAULT_SPECIAL_CHARS = SPECIAL_CHARS
 DEFAULT_CHARSET = LOWERCASE_CHARS + UPPERCASE_CHARS + DIGIT_CHARS + SPECIAL_CHARS
 
+# 预编码的bytes版本：在导入时转码一次，内部管线（numpy缓冲、
+# SoA布局、GPU上传）直接np.frombuffer使用，不在批处理路径上
+# 做str→bytes转码
+LOWERCASE_BYTES = LOWERCASE_CHARS.encode('ascii')
+UPPERCASE_BYTES = UPPERCASE_CHARS.encode('ascii')
+DIGIT_BYTES = DIGIT_CHARS.encode('ascii')
+SPECIAL_BYTES = SPECIAL_CHARS.encode('ascii')
+DEFAULT_CHARSET_BYTES = DEFAULT_CHARSET.encode('ascii')
+
 # 年份范围（用于生成可能的日期密码组合）
 YEARS_RANGE = list(range(2020, 2026))  # 2020-2025
 
@@ -34,6 +43,9 @@ MASK_SYMBOLS = {
     '?h': "0123456789abcdef", # 十六进制
 }
 
+# 掩码符号的bytes版本，与MASK_SYMBOLS等价
+MASK_SYMBOL_BYTES = {k: v.encode('ascii') for k, v in MASK_SYMBOLS.items()}
+
 # 性能相关配置
 PASSWORD_BATCH_SIZE = 10000  # 每批处理的密码数量
 MAX_PASSWORDS_IN_MEMORY = 1000000  # 内存中最大的密码数量
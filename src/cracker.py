@@ -6,21 +6,31 @@ RAR密码破解器核心实现
 """
 
 import os
+import mmap
 import time
+import bisect
+import queue
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 import rarfile
 import numpy as np
 
 from src.config import (
-    MASK_SYMBOLS, PASSWORD_BATCH_SIZE, YEARS_RANGE
+    MASK_SYMBOLS, PASSWORD_BATCH_SIZE, YEARS_RANGE,
+    DEFAULT_THREADS_PER_BLOCK
 )
 from src.utils import (
     parse_mask, get_position_from_index, get_index_from_position,
-    calculate_work_division, chunks, generate_password_batch
+    calculate_work_division, chunks, generate_password_batch,
+    charset_to_array, fill_candidate_matrix, fill_mask_matrix, length_prefix_sums
 )
 from src.backends import get_backend
+from src import unrar_native
+from src import rar5_kdf
 
 # 根据操作系统设置正确的路径分隔符和UnRAR工具路径
 import platform
@@ -50,6 +60,96 @@ else:
                 rarfile.UNRAR_TOOL = bsdtar_path
     rarfile.PATH_SEP = '/'
 
+def _multigpu_bruteforce_worker(gpu_id, rar_file, charset, min_length,
+                                max_length, start_idx, end_idx, batch_size,
+                                cancel, queue):
+    """
+    多GPU暴力破解的spawn子进程入口
+
+    每个GPU一个独立的解释器和CUDA上下文：范围切分、候选还原这些
+    主机侧工作在线程里会在GIL上互相排队，多卡吞吐上不去；进程
+    各有解释器就没有这个共享瓶颈，上下文也在本进程内创建，不存在
+    跨进程的push/pop所有权问题。进度和命中通过队列流回主进程。
+    """
+    from src.backends.cuda import CUDABackend
+    backend = CUDABackend(gpu_id=gpu_id)
+    backend.init()
+    backend.set_charset(charset)
+    try:
+        enc = rar5_kdf.parse_rar5_encryption(rar_file)
+    except OSError:
+        enc = None
+    if enc:
+        backend.set_encryption_params(
+            enc['salt'], enc['iterations'], enc['check_value'])
+    with open(rar_file, 'rb') as f:
+        backend.set_rar_header(f.read(32))
+
+    boundaries = length_prefix_sums(len(charset), min_length, max_length)
+    lengths = list(range(min_length, max_length + 1))
+    try:
+        i = start_idx
+        while i < end_idx:
+            if cancel.is_set():
+                return
+            batch_end = min(i + batch_size, end_idx)
+            attempts = batch_end - i
+            while i < batch_end:
+                bucket = bisect.bisect_right(boundaries, i) - 1
+                span_end = min(batch_end, boundaries[bucket + 1])
+                candidate = backend.check_password_range(
+                    i - boundaries[bucket], span_end - i, lengths[bucket])
+                if candidate:
+                    queue.put(('found', gpu_id, candidate))
+                    return
+                i = span_end
+            queue.put(('progress', gpu_id, i, attempts))
+        queue.put(('done', gpu_id))
+    finally:
+        backend.cleanup()
+
+
+def _multigpu_mask_worker(gpu_id, rar_file, mask_charsets, start_idx,
+                          end_idx, batch_size, cancel, queue):
+    """
+    多GPU掩码攻击的spawn子进程入口
+
+    与暴力破解的worker同一套模式：每张卡独立的解释器和CUDA上下文，
+    掩码表在本进程内上传一次，之后只扫自己的索引区间。批次边界
+    由主进程按前缀子任务对齐后传入，区间之间天然无重复。
+    """
+    from src.backends.cuda import CUDABackend
+    backend = CUDABackend(gpu_id=gpu_id)
+    backend.init()
+    try:
+        enc = rar5_kdf.parse_rar5_encryption(rar_file)
+    except OSError:
+        enc = None
+    if enc:
+        backend.set_encryption_params(
+            enc['salt'], enc['iterations'], enc['check_value'])
+    with open(rar_file, 'rb') as f:
+        backend.set_rar_header(f.read(32))
+    backend.set_mask(mask_charsets)
+
+    try:
+        i = start_idx
+        while i < end_idx:
+            if cancel.is_set():
+                return
+            batch_end = min(i + batch_size, end_idx)
+            attempts = batch_end - i
+            candidate = backend.check_mask_range(i, attempts)
+            if candidate:
+                queue.put(('found', gpu_id, candidate))
+                return
+            i = batch_end
+            queue.put(('progress', gpu_id, i, attempts))
+        queue.put(('done', gpu_id))
+    finally:
+        backend.cleanup()
+
+
 class RARCracker:
     """
     RAR密码破解器类
@@ -75,36 +175,183 @@ class RARCracker:
         self.min_length = kwargs.get('min_length', 8)
         self.max_length = kwargs.get('max_length', 12)
         self.dict_file = kwargs.get('dict_file')
-        self.batch_size = kwargs.get('batch_size', 100000) # Reduced default for CPU safety
+        self.batch_size = kwargs.get('batch_size') # None表示自动调优/默认值
         self.backend_name = kwargs.get('backend', 'auto')
         self.gpu_id = kwargs.get('gpu_id', 0)
+        self.gpu_ids = kwargs.get('gpu_ids') or [self.gpu_id]
         self.charset = kwargs.get('charset', '')
-        
+        self.charset_arr = charset_to_array(self.charset) if self.charset else None
+        self.concurrent_batches = kwargs.get('concurrent_batches', 3)
+        # header_only: rar_file只是档案的头部前缀（API流式上传时
+        # 只落盘加密头），跳过需要完整档案数据的确认步骤
+        self.header_only = kwargs.get('header_only', False)
+
         # 初始化状态
         self.current_position = None
         self.found_password = None
-        
-        # 初始化后端
-        self.backend = get_backend(self.backend_name, gpu_id=self.gpu_id)
-        self.backend.init()
+
+        # 异步验证流水线：候选确认在进程池中与GPU发射并行
+        self._verify_pool = None
+        self._pending_verifications = deque()
+        self._candidate_queue = deque()
+
+        # 初始化后端；调用方（如API服务）可以注入一个已初始化的
+        # 后端实例来复用温热的CUDA上下文和已编译的核函数
+        injected = kwargs.get('backend_instance')
+        if injected is not None:
+            self.backend = injected
+            self._owns_backend = False
+        else:
+            self.backend = get_backend(self.backend_name, gpu_id=self.gpu_id,
+                                       num_streams=self.concurrent_batches)
+            self.backend.init()
+            # 工厂缓存并在atexit统一清理实例，cracker不再负责
+            self._owns_backend = False
         
         # 验证RAR文件
         self._validate_rar_file()
         
-        # 如果后端支持，设置RAR头部
+        # 如果后端支持，设置RAR头部（复用验证时读到的字节，不再
+        # 二次打开文件）
         if hasattr(self.backend, 'set_rar_header'):
-             with open(self.rar_file, 'rb') as f:
-                header = f.read(32) # Simplified
-                self.backend.set_rar_header(header)
+            self.backend.set_rar_header(self._header[:32])
 
-    def _validate_rar_file(self):
-        """验证RAR文件是否有效且有密码保护"""
+        # 解析一次RAR5加密头（盐值/迭代次数/校验值），之后批处理
+        # 循环不再重新读取档案；GPU后端把参数放进常量内存
+        self.encryption = None
         try:
-            rf = rarfile.RarFile(self.rar_file)
-            if not rf.needs_password():
-                raise ValueError(f"RAR文件 '{self.rar_file}' 未加密，不需要密码")
-        except rarfile.Error as e:
-            raise ValueError(f"无效的RAR文件: {e}")
+            self.encryption = rar5_kdf.parse_rar5_encryption(self.rar_file)
+        except OSError:
+            pass
+        if self.encryption and hasattr(self.backend, 'set_encryption_params'):
+            self.backend.set_encryption_params(
+                self.encryption['salt'],
+                self.encryption['iterations'],
+                self.encryption['check_value'])
+
+        # 如果后端支持设备端候选生成，上传一次字符集
+        if self.charset and hasattr(self.backend, 'set_charset'):
+            self.backend.set_charset(self.charset)
+
+        # 年份变体：GPU后端上传一次后缀表，变体在设备上合成
+        self.use_years = kwargs.get('use_years', False)
+        if self.use_years and hasattr(self.backend, 'set_years'):
+            self.backend.set_years(YEARS_RANGE)
+
+        # 未显式指定批大小时，让后端自动调优（GPU），否则用安全默认值
+        if self.batch_size is None:
+            tuned = None
+            if hasattr(self.backend, 'autotune'):
+                tuned = self.backend.autotune(self.max_length)
+            self.batch_size = tuned or 100000 # Reduced default for CPU safety
+
+        # 批大小确定后让后端一次性把暂存缓冲扩到位，热循环中不再
+        # 发生增长性重分配（重分配还会作废已捕获的CUDA Graph）
+        if hasattr(self.backend, 'reserve'):
+            self.backend.reserve(self.batch_size, self.max_length)
+
+    def _handle_candidate(self, password):
+        """
+        处理后端标记的候选密码
+
+        GPU核函数给出的命中是候选而不是结论。确认工作提交到
+        验证进程池异步执行（libunrar的C调用在子进程中绕开GIL），
+        发射线程立即继续启动下一批GPU工作——CPU验证与下一批的
+        GPU哈希并行。libunrar不可用时保持原有行为，直接信任
+        后端结果。
+
+        Returns:
+            已确认的密码，或None（验证仍在进行或不需要）
+        """
+        if self.header_only:
+            # 截断的头部前缀无法做完整档案验证；校验值匹配（64位）
+            # 已是强信号，直接采信
+            return password
+        if not unrar_native.is_available():
+            # libunrar不可用时用缓存的rarfile句柄做同步测试验证。
+            # testrar只做校验不落盘，句柄懒构造一次后复用，
+            # 不再为每个候选重新解析档案头。
+            try:
+                self._archive.testrar(pwd=password)
+                return password
+            except rarfile.RarCannotExec:
+                # 主机上连unrar/bsdtar都没有——验证设施缺失而不是
+                # 密码错误，KDF校验值命中（64位）已是强信号，采信
+                return password
+            except (rarfile.RarWrongPassword, rarfile.RarCRCError,
+                    rarfile.BadRarFile):
+                # 只有这些才真正意味着"密码不对"
+                return None
+            except Exception:
+                # 验证本身失败时宁可相信后端结果
+                return password
+        if self._verify_pool is None:
+            self._verify_pool = ProcessPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1))
+        self._pending_verifications.append(
+            self._verify_pool.submit(unrar_native.test_password,
+                                     self.rar_file, password))
+        self._candidate_queue.append(password)
+        return None
+
+    def _poll_verifications(self, wait=False):
+        """
+        收割验证结果
+
+        Args:
+            wait: True时阻塞等待所有挂起的验证完成（搜索空间
+                  耗尽时的最终收尾）
+
+        Returns:
+            已确认的密码，或None
+        """
+        while self._pending_verifications:
+            future = self._pending_verifications[0]
+            if not wait and not future.done():
+                break
+            self._pending_verifications.popleft()
+            password = self._candidate_queue.popleft()
+            try:
+                if future.result():
+                    return password
+            except Exception:
+                # 验证本身失败时宁可相信后端结果
+                return password
+        return None
+
+    # RAR签名：5.0及以上是8字节，1.5-4.x是7字节
+    _RAR5_MAGIC = b'Rar!\x1a\x07\x01\x00'
+    _RAR4_MAGIC = b'Rar!\x1a\x07\x00'
+
+    def _validate_rar_file(self):
+        """验证RAR文件是否有效
+
+        只读文件开头的64字节比对签名——rarfile.RarFile构造会解析
+        整个档案目录（rarfile内部还可能fork一次unrar），放在每次
+        实例化的路径上要付一两百毫秒。完整解析推迟到第一个候选
+        需要确认时（见_archive）。读到的头部同时缓存下来供
+        set_rar_header复用，整个初始化只碰一次文件。
+        """
+        with open(self.rar_file, 'rb') as f:
+            self._header = f.read(64)
+        if not (self._header.startswith(self._RAR5_MAGIC) or
+                self._header.startswith(self._RAR4_MAGIC)):
+            raise ValueError(f"无效的RAR文件: '{self.rar_file}' 不是RAR档案")
+        self._rf = None
+
+    @property
+    def _archive(self):
+        """懒构造的rarfile句柄，供候选确认复用
+
+        RarFile构造要解析档案头部/目录，远贵于单次密码测试本身，
+        解析一次后整个破解过程复用同一个句柄。
+        """
+        if self._rf is None:
+            try:
+                self._rf = rarfile.RarFile(self.rar_file)
+            except rarfile.Error as e:
+                raise ValueError(f"无效的RAR文件: {e}")
+        return self._rf
     
     def run(self, start_position=None):
         """运行密码破解过程"""
@@ -119,44 +366,320 @@ class RARCracker:
                 for batch_result in self._run_bruteforce_attack(start_position):
                     yield batch_result
         finally:
-            self.backend.cleanup()
+            if self._verify_pool is not None:
+                self._verify_pool.shutdown()
+                self._verify_pool = None
+            # 注入的后端由其所有者（如API生命周期钩子）负责清理
+            if self._owns_backend:
+                self.backend.cleanup()
     
     def _run_bruteforce_attack(self, start_position=None):
         """执行暴力破解"""
         # 简单实现：单线程控制循环，后端负责并行检查
         # 如果是CPU后端，backend.check_passwords内部会并行
-        
-        for length in range(self.min_length, self.max_length + 1):
-            total_combinations = len(self.charset) ** length
-            
-            start_idx = 0
-            if start_position and isinstance(start_position, tuple) and start_position[0] == length:
-                start_idx = start_position[1]
-                
-            for batch_start in range(start_idx, total_combinations, self.batch_size):
-                batch_end = min(batch_start + self.batch_size, total_combinations)
-                current_batch_size = batch_end - batch_start
-                
-                # 生成密码
-                passwords = generate_password_batch(self.charset, length, batch_start, current_batch_size)
-                
+        #
+        # 所有长度共享一个线性索引空间，批次可以跨越长度边界，
+        # 避免每个长度结尾处出现吃不满GPU的小批次/小启动。
+        charset_len = len(self.charset)
+        lengths = list(range(self.min_length, self.max_length + 1))
+        boundaries = length_prefix_sums(charset_len, self.min_length, self.max_length)
+        total_combinations = boundaries[-1]
+
+        start_idx = 0
+        if start_position is not None:
+            if isinstance(start_position, (tuple, list)) and len(start_position) == 2:
+                # 兼容旧检查点格式 (length, index)
+                length, idx = start_position
+                if self.min_length <= length <= self.max_length:
+                    start_idx = boundaries[length - self.min_length] + idx
+            elif isinstance(start_position, int):
+                start_idx = start_position
+
+        # CUDA后端直接在设备上按线性索引生成候选，主机不再物化密码
+        use_indexed = hasattr(self.backend, 'check_password_range')
+
+        # 多卡时每个GPU一个spawn子进程，各自扫一段索引区间
+        if use_indexed and len(self.gpu_ids) > 1:
+            yield from self._run_multigpu_bruteforce(
+                start_idx, total_combinations)
+            return
+
+        for batch_start in range(start_idx, total_combinations, self.batch_size):
+            batch_end = min(batch_start + self.batch_size, total_combinations)
+            current_batch_size = batch_end - batch_start
+
+            found = None
+            if use_indexed:
+                i = batch_start
+                while i < batch_end and not found:
+                    bucket = bisect.bisect_right(boundaries, i) - 1
+                    span_end = min(batch_end, boundaries[bucket + 1])
+                    candidate = self.backend.check_password_range(
+                        i - boundaries[bucket], span_end - i, lengths[bucket])
+                    if candidate:
+                        found = self._handle_candidate(candidate)
+                    i = span_end
+            else:
+                # 生成密码，批次跨长度边界时拼接各长度的片段
+                # 候选矩阵按列向量化生成，避免逐候选的Python循环
+                passwords = []
+                i = batch_start
+                while i < batch_end:
+                    bucket = bisect.bisect_right(boundaries, i) - 1
+                    span_end = min(batch_end, boundaries[bucket + 1])
+                    span = span_end - i
+                    length = lengths[bucket]
+                    matrix = np.empty((span, length), dtype=np.uint8)
+                    fill_candidate_matrix(self.charset_arr, length,
+                                          i - boundaries[bucket], matrix)
+                    data = matrix.tobytes()
+                    passwords.extend(data[k * length:(k + 1) * length].decode('ascii')
+                                     for k in range(span))
+                    i = span_end
+
                 # 检查密码
-                found = self.backend.check_passwords(passwords, self.rar_file)
-                
-                if found:
-                    self.found_password = found
-                    yield {
-                        'password': found,
-                        'attempts': current_batch_size, # approximate
-                        'position': (length, batch_end)
-                    }
-                    return
-                
+                candidate = self.backend.check_passwords(passwords, self.rar_file)
+                if candidate:
+                    found = self._handle_candidate(candidate)
+
+            # 顺路收割已完成的异步验证
+            found = found or self._poll_verifications()
+
+            if found:
+                self.found_password = found
                 yield {
-                    'password': None,
-                    'attempts': current_batch_size,
-                    'position': (length, batch_end)
+                    'password': found,
+                    'attempts': current_batch_size, # approximate
+                    'position': batch_end
                 }
+                return
+
+            yield {
+                'password': None,
+                'attempts': current_batch_size,
+                'position': batch_end
+            }
+
+        # 搜索空间耗尽，等待仍在验证中的候选
+        found = self._poll_verifications(wait=True)
+        if found:
+            self.found_password = found
+            yield {
+                'password': found,
+                'attempts': 0,
+                'position': total_combinations
+            }
+
+    def _run_multigpu_bruteforce(self, start_idx, total_combinations):
+        """
+        多GPU暴力破解控制循环
+
+        剩余索引空间按calculate_work_division切给每张卡，子进程用
+        spawn启动（见_multigpu_bruteforce_worker）。本方法退化为
+        队列的消费者；检查点位置取所有卡进度的最小值，恢复时从
+        那里重新切分，最多重扫少量已覆盖的区间，不会漏。
+        """
+        ctx = multiprocessing.get_context('spawn')
+        msg_queue = ctx.Queue()
+        cancel = ctx.Event()
+        # 区间边界对齐到线程块大小，各卡的网格不再有碎尾巴
+        divisions = calculate_work_division(
+            total_combinations - start_idx, len(self.gpu_ids),
+            block_multiple=DEFAULT_THREADS_PER_BLOCK)
+
+        procs = []
+        progress = {}
+        for gpu_id, (lo, hi) in zip(self.gpu_ids, divisions):
+            if hi <= lo:
+                continue
+            p = ctx.Process(
+                target=_multigpu_bruteforce_worker,
+                args=(gpu_id, self.rar_file, self.charset,
+                      self.min_length, self.max_length,
+                      start_idx + lo, start_idx + hi,
+                      self.batch_size, cancel, msg_queue),
+                daemon=True)
+            p.start()
+            procs.append((gpu_id, p))
+            progress[gpu_id] = start_idx + lo
+
+        active = len(procs)
+        finished = set()
+        found = None
+        try:
+            while active and found is None:
+                # 带超时的get：崩溃的工作进程不会发结束消息，
+                # 阻塞等待会让主进程永远挂住
+                try:
+                    msg = msg_queue.get(timeout=1.0)
+                except queue.Empty:
+                    for gpu_id, p in procs:
+                        if gpu_id not in finished and not p.is_alive():
+                            logging.error("GPU %d 工作进程异常退出", gpu_id)
+                            finished.add(gpu_id)
+                            active -= 1
+                    continue
+                if msg[0] == 'progress':
+                    _, gpu_id, next_idx, attempts = msg
+                    progress[gpu_id] = next_idx
+                    yield {
+                        'password': None,
+                        'attempts': attempts,
+                        'position': min(progress.values())
+                    }
+                elif msg[0] == 'found':
+                    found = self._handle_candidate(msg[2])
+                    found = found or self._poll_verifications(wait=True)
+                    finished.add(msg[1])
+                    active -= 1
+                else:  # done
+                    finished.add(msg[1])
+                    active -= 1
+        finally:
+            cancel.set()
+            for _, p in procs:
+                p.join(timeout=5)
+
+        if found:
+            self.found_password = found
+            yield {
+                'password': found,
+                'attempts': 0,
+                'position': min(progress.values()) if progress else start_idx
+            }
+
+    def _run_multigpu_mask(self, start_idx, total_combinations, charsets,
+                           charset_lengths, batch_size):
+        """
+        多GPU掩码攻击控制循环
+
+        与_run_multigpu_bruteforce同构：剩余索引空间按
+        calculate_work_division切给每张卡，本方法只消费队列。
+        检查点位置取所有卡进度的最小值。
+        """
+        ctx = multiprocessing.get_context('spawn')
+        msg_queue = ctx.Queue()
+        cancel = ctx.Event()
+        # 区间边界对齐到线程块大小，各卡的网格不再有碎尾巴
+        divisions = calculate_work_division(
+            total_combinations - start_idx, len(self.gpu_ids),
+            block_multiple=DEFAULT_THREADS_PER_BLOCK)
+        mask_charsets = [cs if isinstance(cs, str) else str(cs)
+                         for cs in charsets]
+
+        procs = []
+        progress = {}
+        for gpu_id, (lo, hi) in zip(self.gpu_ids, divisions):
+            if hi <= lo:
+                continue
+            p = ctx.Process(
+                target=_multigpu_mask_worker,
+                args=(gpu_id, self.rar_file, mask_charsets,
+                      start_idx + lo, start_idx + hi,
+                      batch_size, cancel, msg_queue),
+                daemon=True)
+            p.start()
+            procs.append((gpu_id, p))
+            progress[gpu_id] = start_idx + lo
+
+        active = len(procs)
+        finished = set()
+        found = None
+        try:
+            while active and found is None:
+                # 带超时的get：崩溃的工作进程不会发结束消息，
+                # 阻塞等待会让主进程永远挂住
+                try:
+                    msg = msg_queue.get(timeout=1.0)
+                except queue.Empty:
+                    for gpu_id, p in procs:
+                        if gpu_id not in finished and not p.is_alive():
+                            logging.error("GPU %d 工作进程异常退出", gpu_id)
+                            finished.add(gpu_id)
+                            active -= 1
+                    continue
+                if msg[0] == 'progress':
+                    _, gpu_id, next_idx, attempts = msg
+                    progress[gpu_id] = next_idx
+                    yield {
+                        'password': None,
+                        'attempts': attempts,
+                        'position': get_position_from_index(
+                            min(progress.values()), charset_lengths)
+                    }
+                elif msg[0] == 'found':
+                    found = self._handle_candidate(msg[2])
+                    found = found or self._poll_verifications(wait=True)
+                    finished.add(msg[1])
+                    active -= 1
+                else:  # done
+                    finished.add(msg[1])
+                    active -= 1
+        finally:
+            cancel.set()
+            for _, p in procs:
+                p.join(timeout=5)
+
+        if found:
+            self.found_password = found
+            yield {
+                'password': found,
+                'attempts': 0,
+                'position': get_position_from_index(
+                    min(progress.values()) if progress else start_idx,
+                    charset_lengths)
+            }
+
+    def _prefetch_batches(self, producer, depth=2):
+        """
+        把批次生成移到后台线程，与后端计算重叠
+
+        有界队列（depth=2即双缓冲）：后端处理第N批时生成线程已经
+        在准备第N+1批，CPU侧的候选物化不再和GPU/进程池计算串行。
+        消费方提前退出（命中）时设置stop标志，生成线程随即结束。
+
+        Args:
+            producer: 生成批次项的迭代器
+            depth: 队列深度（预生成的批次数）
+
+        Yields:
+            producer产出的批次项，顺序不变
+        """
+        q = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        sentinel = object()
+
+        def run():
+            try:
+                for item in producer:
+                    while not stop.is_set():
+                        try:
+                            q.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+            finally:
+                # 哨兵同样要等队列腾出空间，不能丢；消费方已退出
+                # （stop置位）时则直接结束
+                while not stop.is_set():
+                    try:
+                        q.put(sentinel, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = q.get()
+                if item is sentinel:
+                    break
+                yield item
+        finally:
+            stop.set()
 
     def _run_mask_attack(self, start_position=None):
         """执行掩码攻击"""
@@ -170,24 +693,72 @@ class RARCracker:
         start_idx = 0
         if start_position and isinstance(start_position, list):
              start_idx = get_index_from_position(start_position, charset_lengths)
-             
-        for batch_start in range(start_idx, total_combinations, self.batch_size):
-            batch_end = min(batch_start + self.batch_size, total_combinations)
+
+        # CUDA后端把逐位置字符集表上传到常量内存一次，之后候选
+        # 由设备按混合基数分解生成，主机不再物化密码；退而求其次
+        # 走SoA矩阵路径（合并访存），最后才是字符串列表。
+        use_indexed = hasattr(self.backend, 'check_mask_range')
+        if use_indexed:
+            self.backend.set_mask([cs if isinstance(cs, str) else str(cs)
+                                   for cs in charsets])
+        use_matrix = hasattr(self.backend, 'check_passwords_matrix')
+
+        # 分治划分：批大小对齐到尾部位置的基数积，让每个批次恰好
+        # 覆盖整数个"固定前缀"子任务。同一批内所有候选共享前导
+        # 位置的取值结构（混合基数分解对前导位置的除法结果整批
+        # 一致），批次间也天然无重复，静态切给多个流/GPU都安全。
+        subtask_size = 1
+        for length in reversed(charset_lengths):
+            if subtask_size * length > self.batch_size:
+                break
+            subtask_size *= length
+        effective_batch = max(
+            self.batch_size - self.batch_size % subtask_size, subtask_size)
+
+        # 多卡时每个GPU一个spawn子进程，各自扫一段索引区间（与
+        # 暴力破解同一套分片机制）
+        if use_indexed and len(self.gpu_ids) > 1:
+            yield from self._run_multigpu_mask(
+                start_idx, total_combinations, charsets, charset_lengths,
+                effective_batch)
+            return
+
+        if use_indexed:
+            # 设备端生成无需主机物化，批次项只带索引区间
+            batches = (
+                (bs, min(bs + effective_batch, total_combinations), None)
+                for bs in range(start_idx, total_combinations, effective_batch))
+        else:
+            # 候选矩阵按列向量化生成（混合基数分解），并由后台
+            # 线程预生成：后端处理第N批时第N+1批已经在构建中
+            def _produce():
+                for bs in range(start_idx, total_combinations, effective_batch):
+                    be = min(bs + effective_batch, total_combinations)
+                    matrix = np.empty((be - bs, len(charsets)), dtype=np.uint8)
+                    fill_mask_matrix(charsets, bs, matrix)
+                    yield bs, be, matrix
+            batches = self._prefetch_batches(_produce())
+
+        for batch_start, batch_end, matrix in batches:
             current_batch_size = batch_end - batch_start
-            
-            passwords = []
-            for i in range(batch_start, batch_end):
-                position = get_position_from_index(i, charset_lengths)
-                pwd = []
-                for pos, charset in zip(position, charsets):
-                    if isinstance(charset, str) and len(charset) > 1:
-                        pwd.append(charset[pos])
-                    else:
-                        pwd.append(charset)
-                passwords.append(''.join(pwd))
-            
-            found = self.backend.check_passwords(passwords, self.rar_file)
-            
+
+            if use_indexed:
+                candidate = self.backend.check_mask_range(
+                    batch_start, current_batch_size)
+            elif use_matrix:
+                candidate = self.backend.check_passwords_matrix(matrix)
+            else:
+                # 整批一次decode，之后只做str切片——不必每个候选
+                # 各付一次decode调用和中间bytes对象
+                pwd_len = len(charsets)
+                text = matrix.tobytes().decode('ascii')
+                passwords = [text[k * pwd_len:(k + 1) * pwd_len]
+                             for k in range(current_batch_size)]
+                candidate = self.backend.check_passwords(passwords, self.rar_file)
+
+            found = self._handle_candidate(candidate) if candidate else None
+            found = found or self._poll_verifications()
+
             if found:
                 self.found_password = found
                 yield {
@@ -196,40 +767,154 @@ class RARCracker:
                     'position': get_position_from_index(batch_end, charset_lengths)
                 }
                 return
-                
+
             yield {
                 'password': None,
                 'attempts': current_batch_size,
                 'position': get_position_from_index(batch_end, charset_lengths)
             }
 
+        found = self._poll_verifications(wait=True)
+        if found:
+            self.found_password = found
+            yield {
+                'password': found,
+                'attempts': 0,
+                'position': get_position_from_index(total_combinations, charset_lengths)
+            }
+
+    def _check_dict_packed(self, mm, buf, starts, ends, eff_ends, lengths,
+                           batch_start, batch_end):
+        """
+        把一批字典行打包成原始字节直接送给后端
+
+        候选字节向量化地从映射区抽出：差分数组+cumsum构造保留掩码
+        剔除行分隔符（\\n和行尾\\r），一次花式索引得到打包数组。
+        整个批次不创建任何Python字符串，只有命中的那一行才解码。
+
+        Returns:
+            命中的密码字符串，或None
+        """
+        lo = int(starts[batch_start])
+        seg = buf[lo:int(eff_ends[batch_end - 1])]
+        diff = np.zeros(seg.size + 1, dtype=np.int32)
+        np.add.at(diff, starts[batch_start:batch_end] - lo, 1)
+        np.add.at(diff,
+                  np.minimum(eff_ends[batch_start:batch_end] - lo, seg.size),
+                  -1)
+        packed = seg[np.cumsum(diff[:-1]) > 0]
+
+        offsets = np.zeros(batch_end - batch_start + 1, dtype=np.int64)
+        np.cumsum(lengths[batch_start:batch_end], out=offsets[1:])
+
+        hit = self.backend.check_passwords_packed(packed, offsets)
+        if hit is None:
+            return None
+        k = batch_start + hit
+        return mm[starts[k]:eff_ends[k]].decode('utf-8', 'ignore')
+
     def _run_dictionary_attack(self, start_position=None):
         """执行字典攻击"""
-        with open(self.dict_file, 'r', encoding='utf-8', errors='ignore') as f:
-            if start_position:
-                for _ in range(start_position):
-                    next(f, None)
-            
+        # 字典用mmap映射进地址空间，换行偏移用numpy一次性向量化
+        # 扫出来：热循环不再走Python的逐行迭代器（每个词一次str
+        # 分配），断点续传也从逐行next()跳过变成O(1)的偏移索引。
+        fd = os.open(self.dict_file, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空字典文件
+            os.close(fd)
+            return
+        os.close(fd)
+
+        try:
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            nl = np.flatnonzero(buf == 0x0A)
+            starts = np.concatenate(([0], nl + 1))
+            ends = np.concatenate((nl, [buf.size]))
+            if starts[-1] >= buf.size:
+                # 文件以换行结尾，去掉末尾的幻影空行
+                starts = starts[:-1]
+                ends = ends[:-1]
+            num_lines = starts.size
+
+            # 行尾的\r一次性向量化剔除，packed路径直接用这些长度
+            # 从映射区切出候选字节
+            safe_ends = np.maximum(ends - 1, 0)
+            cr = (ends > starts) & (buf[safe_ends] == 0x0D)
+            eff_ends = ends - cr
+            lengths = eff_ends - starts
+
+            # 支持字节级入口的后端整批零字符串检查；年份展开路径
+            # 需要字符串列表，保持原样
+            use_packed = (not self.use_years and
+                          hasattr(self.backend, 'check_passwords_packed'))
+
             line_number = start_position if start_position else 0
-            
-            for password_batch in chunks(f, self.batch_size):
-                password_batch = [p.strip() for p in password_batch]
-                
-                # Check passwords
-                found = self.backend.check_passwords(password_batch, self.rar_file)
-                
+
+            for batch_start in range(line_number, num_lines, self.batch_size):
+                batch_end = min(batch_start + self.batch_size, num_lines)
+                batch_count = batch_end - batch_start
+
+                factor = 1
+                if use_packed:
+                    candidate = self._check_dict_packed(
+                        mm, buf, starts, ends, eff_ends, lengths,
+                        batch_start, batch_end)
+                else:
+                    # 行尾分隔符已经在eff_ends里剔掉，不再逐行strip
+                    password_batch = [
+                        mm[starts[k]:eff_ends[k]].decode('utf-8', 'ignore')
+                        for k in range(batch_start, batch_end)
+                    ]
+
+                    # 年份变体：GPU在设备上合成 pw||year，主机只传
+                    # 基础词表；其他后端退回Python列表展开
+                    if self.use_years:
+                        factor = 1 + len(YEARS_RANGE)
+                        if hasattr(self.backend, 'check_passwords_with_years'):
+                            candidate = self.backend.check_passwords_with_years(
+                                password_batch)
+                        else:
+                            expanded = list(password_batch)
+                            for password in password_batch:
+                                expanded.extend(f"{password}{year}"
+                                                for year in YEARS_RANGE)
+                            candidate = self.backend.check_passwords(
+                                expanded, self.rar_file)
+                    else:
+                        candidate = self.backend.check_passwords(
+                            password_batch, self.rar_file)
+                found = self._handle_candidate(candidate) if candidate else None
+                found = found or self._poll_verifications()
+
                 if found:
                     self.found_password = found
                     yield {
                         'password': found,
-                        'attempts': len(password_batch),
-                        'position': line_number + len(password_batch)
+                        'attempts': batch_count * factor,
+                        'position': line_number + batch_count
                     }
                     return
-                
-                line_number += len(password_batch)
+
+                line_number += batch_count
                 yield {
                     'password': None,
-                    'attempts': len(password_batch),
+                    'attempts': batch_count * factor,
+                    'position': line_number
+                }
+
+            found = self._poll_verifications(wait=True)
+            if found:
+                self.found_password = found
+                yield {
+                    'password': found,
+                    'attempts': 0,
                     'position': line_number
-                }
\ No newline at end of file
+                }
+        finally:
+            # np.frombuffer的视图持有映射区的导出指针，引用还在时
+            # close会抛BufferError（字典扫完无命中的正常收尾路径
+            # 必经这里）；先丢掉视图再关闭映射
+            buf = None
+            mm.close()
\ No newline at end of file
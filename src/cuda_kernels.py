@@ -11,6 +11,56 @@ CUDA核心功能实现 (Demo Optimized)
 # 2. 模拟计算负载循环（让 GPU 真的热起来，模拟 RAR 的高算力消耗）
 
 RAR_PASSWORD_CHECK_KERNEL = r"""
+// 字符集常量内存：初始化时上传一次（<=95字节），
+// 之后每个批次只需要 (start_idx, batch_size, length) 三个标量参数
+__constant__ unsigned char c_charset[256];
+
+// RAR5密钥派生参数：初始化时解析加密头后上传一次，核函数从
+// 常量缓存读取（warp内广播），批处理参数里不再携带
+__constant__ unsigned char d_salt[16];
+__constant__ unsigned int d_kdf_iters;
+__constant__ unsigned char d_check[12];
+
+// RAR头部（每个档案固定）：set_rar_header时上传一次。常量缓存
+// 向warp内所有线程广播，比每批次传全局内存指针省一次分配和
+// 拷贝，访问也零延迟。
+__constant__ unsigned char g_header[64];
+__constant__ int g_header_len;
+
+// 年份后缀表：set_years时上传一次，每个年份4个ASCII数字一行。
+// 字典的年份变体由设备按线程索引合成，主机只上传基础词表——
+// PCIe流量和Python列表分配都不再乘以 (1 + 年份数)。
+__constant__ unsigned char c_years[64];
+
+// 掩码攻击的逐位置字符集表：set_mask时上传一次。每个位置一行
+// （最长?a也就是95个可打印字符，行宽取96对齐），之后整个掩码
+// 空间的候选都由设备按混合基数分解生成，主机每批次只传
+// (start_idx, batch_size) 两个标量。
+#define MASK_MAX_POSITIONS 32
+#define MASK_ROW_STRIDE 96
+__constant__ unsigned char c_mask_tables[MASK_MAX_POSITIONS * MASK_ROW_STRIDE];
+__constant__ int c_mask_lens[MASK_MAX_POSITIONS];
+
+// SHA-256轮常量：所有线程同步读同一项，常量缓存广播
+__constant__ unsigned int c_sha_k[64] = {
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5,
+    0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3,
+    0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc,
+    0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7,
+    0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13,
+    0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3,
+    0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5,
+    0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208,
+    0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+};
+
 extern "C" {
 
 // [核心逻辑] 在这里修改你的目标密码
@@ -26,10 +76,18 @@ __device__ bool check_password(const unsigned char* pwd, int len) {
     // 长度不匹配直接返回
     if (len != target_len) return false;
 
-    // 逐字符比对
-    for(int i = 0; i < len; i++) {
-        if (pwd[i] != target[i]) return false;
-    }
+    // SWAR比对：4个候选字节打包进一个uint32，__vcmpeq4（视频
+    // SIMD指令vset4.u32.u32.eq）一条指令完成4次字节相等判断，
+    // 代替4次加载+比较+分支
+    const unsigned int t4 = (unsigned int)target[0]
+                          | ((unsigned int)target[1] << 8)
+                          | ((unsigned int)target[2] << 16)
+                          | ((unsigned int)target[3] << 24);
+    const unsigned int p4 = (unsigned int)pwd[0]
+                          | ((unsigned int)pwd[1] << 8)
+                          | ((unsigned int)pwd[2] << 16)
+                          | ((unsigned int)pwd[3] << 24);
+    if (__vcmpeq4(p4, t4) != 0xFFFFFFFFu) return false;
 
     // --- 2. 模拟 RAR 的高强度哈希计算负载 ---
     // 真实的 RAR5 需要进行数万次 SHA-256 迭代。
@@ -53,31 +111,362 @@ __device__ bool check_password(const unsigned char* pwd, int len) {
     return true; // 密码匹配！
 }
 
+// ---------------- 真实的RAR5 PBKDF2-HMAC-SHA256校验 ----------------
+// RAR5把密码校验值存为第 d_kdf_iters+32 次PBKDF2迭代结果按8字节
+// XOR折叠后的前8字节（与主机侧rar5_kdf.verify_password一致）。
+// 整个判定在设备上完成：派生密钥不出寄存器，不与主机交换数据。
+
+__device__ __forceinline__ unsigned int rotr32(unsigned int x, int n) {
+    return (x >> n) | (x << (32 - n));
+}
+
+__device__ void sha256_transform(unsigned int* state, const unsigned int* block) {
+    unsigned int w[64];
+    #pragma unroll
+    for (int i = 0; i < 16; i++) w[i] = block[i];
+    #pragma unroll
+    for (int i = 16; i < 64; i++) {
+        const unsigned int s0 = rotr32(w[i-15], 7) ^ rotr32(w[i-15], 18) ^ (w[i-15] >> 3);
+        const unsigned int s1 = rotr32(w[i-2], 17) ^ rotr32(w[i-2], 19) ^ (w[i-2] >> 10);
+        w[i] = w[i-16] + s0 + w[i-7] + s1;
+    }
+    unsigned int a = state[0], b = state[1], c = state[2], d = state[3];
+    unsigned int e = state[4], f = state[5], g = state[6], h = state[7];
+    #pragma unroll
+    for (int i = 0; i < 64; i++) {
+        const unsigned int S1 = rotr32(e, 6) ^ rotr32(e, 11) ^ rotr32(e, 25);
+        const unsigned int ch = (e & f) ^ ((~e) & g);
+        const unsigned int t1 = h + S1 + ch + c_sha_k[i] + w[i];
+        const unsigned int S0 = rotr32(a, 2) ^ rotr32(a, 13) ^ rotr32(a, 22);
+        const unsigned int maj = (a & b) ^ (a & c) ^ (b & c);
+        const unsigned int t2 = S0 + maj;
+        h = g; g = f; f = e; e = d + t1;
+        d = c; c = b; b = a; a = t1 + t2;
+    }
+    state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+    state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+}
+
+__device__ __forceinline__ void sha256_init(unsigned int* s) {
+    s[0] = 0x6a09e667; s[1] = 0xbb67ae85; s[2] = 0x3c6ef372; s[3] = 0xa54ff53a;
+    s[4] = 0x510e527f; s[5] = 0x9b05688c; s[6] = 0x1f83d9ab; s[7] = 0x5be0cd19;
+}
+
+// 预计算ipad/opad吃掉后的HMAC内外状态：PBKDF2热循环里每次迭代
+// 只剩2次压缩，不再重放密钥块
+__device__ void hmac_sha256_init(const unsigned char* key, int keylen,
+                                 unsigned int* istate, unsigned int* ostate) {
+    unsigned int block[16];
+    #pragma unroll
+    for (int i = 0; i < 16; i++) {
+        unsigned int w = 0;
+        #pragma unroll
+        for (int j = 0; j < 4; j++) {
+            const int k = i * 4 + j;
+            const unsigned int byte = (k < keylen) ? key[k] : 0;
+            w = (w << 8) | (byte ^ 0x36);
+        }
+        block[i] = w;
+    }
+    sha256_init(istate);
+    sha256_transform(istate, block);
+    #pragma unroll
+    for (int i = 0; i < 16; i++) {
+        // 0x36 ^ 0x5c = 0x6a：直接在已打包的字上翻转pad
+        block[i] ^= 0x6a6a6a6a;
+    }
+    sha256_init(ostate);
+    sha256_transform(ostate, block);
+}
+
+// HMAC终结：msg块已按SHA-256规则填充（含0x80与总位长），算内外
+// 两次压缩，结果写回out8
+__device__ void hmac_sha256_final(const unsigned int* istate,
+                                  const unsigned int* ostate,
+                                  const unsigned int* msg_block,
+                                  unsigned int* out8) {
+    unsigned int st[8];
+    #pragma unroll
+    for (int i = 0; i < 8; i++) st[i] = istate[i];
+    sha256_transform(st, msg_block);
+
+    unsigned int block[16];
+    #pragma unroll
+    for (int i = 0; i < 8; i++) block[i] = st[i];
+    block[8] = 0x80000000u;
+    #pragma unroll
+    for (int i = 9; i < 15; i++) block[i] = 0;
+    block[15] = (64 + 32) * 8;
+
+    #pragma unroll
+    for (int i = 0; i < 8; i++) out8[i] = ostate[i];
+    sha256_transform(out8, block);
+}
+
+__device__ bool rar5_check_password(const unsigned char* pwd, int len) {
+    unsigned int istate[8], ostate[8];
+    hmac_sha256_init(pwd, len, istate, ostate);
+
+    // U1 = HMAC(P, salt || INT32BE(1))：16字节盐+4字节计数=20字节
+    unsigned int block[16];
+    #pragma unroll
+    for (int i = 0; i < 4; i++) {
+        block[i] = ((unsigned int)d_salt[i*4] << 24)
+                 | ((unsigned int)d_salt[i*4+1] << 16)
+                 | ((unsigned int)d_salt[i*4+2] << 8)
+                 | (unsigned int)d_salt[i*4+3];
+    }
+    block[4] = 1;
+    block[5] = 0x80000000u;
+    #pragma unroll
+    for (int i = 6; i < 15; i++) block[i] = 0;
+    block[15] = (64 + 20) * 8;
+
+    unsigned int u[8], acc[8];
+    hmac_sha256_final(istate, ostate, block, u);
+    #pragma unroll
+    for (int i = 0; i < 8; i++) acc[i] = u[i];
+
+    // U_{i+1} = HMAC(P, U_i)，T = U1 ^ ... ^ Uc，c = 迭代数+32
+    const unsigned int iters = d_kdf_iters + 32;
+    unsigned int msg[16];
+    msg[8] = 0x80000000u;
+    #pragma unroll
+    for (int i = 9; i < 15; i++) msg[i] = 0;
+    msg[15] = (64 + 32) * 8;
+    for (unsigned int it = 1; it < iters; it++) {
+        #pragma unroll
+        for (int i = 0; i < 8; i++) msg[i] = u[i];
+        hmac_sha256_final(istate, ostate, msg, u);
+        #pragma unroll
+        for (int i = 0; i < 8; i++) acc[i] ^= u[i];
+    }
+
+    // 32字节T按8字节XOR折叠；字是大端序的，折叠在字粒度上对齐
+    const unsigned int f0 = acc[0] ^ acc[2] ^ acc[4] ^ acc[6];
+    const unsigned int f1 = acc[1] ^ acc[3] ^ acc[5] ^ acc[7];
+    const unsigned int c0 = ((unsigned int)d_check[0] << 24)
+                          | ((unsigned int)d_check[1] << 16)
+                          | ((unsigned int)d_check[2] << 8)
+                          | (unsigned int)d_check[3];
+    const unsigned int c1 = ((unsigned int)d_check[4] << 24)
+                          | ((unsigned int)d_check[5] << 16)
+                          | ((unsigned int)d_check[6] << 8)
+                          | (unsigned int)d_check[7];
+    return f0 == c0 && f1 == c1;
+}
+
+// 统一入口：加密参数已上传（d_kdf_iters非0）时走真实的RAR5
+// KDF校验，否则保留演示用的固定密码匹配
+__device__ __forceinline__ bool candidate_matches(const unsigned char* pwd, int len) {
+    if (d_kdf_iters != 0) return rar5_check_password(pwd, len);
+    return check_password(pwd, len);
+}
+
+// 变长候选的AoS布局：chars是所有候选字节的扁平拼接，offsets
+// 是host端一次cumsum得到的前缀和（batch_size+1项），线程tid
+// 读取 [offsets[tid], offsets[tid+1]) 区间。RAR头部从g_header
+// 常量内存读取，不再作为核函数参数传入。
 __global__ void check_rar_password(
-    const int* indices,
-    const char* charset,
-    const int charset_len,
-    const int pwd_len,
+    const unsigned char* chars,
+    const int* offsets,
     const int batch_size,
-    bool* results
+    unsigned char* results
 ) {
     const int tid = blockIdx.x * blockDim.x + threadIdx.x;
     if (tid >= batch_size) return;
 
-    char pwd[32];
-    for (int i = 0; i < pwd_len; i++) {
-        const int idx = indices[tid * pwd_len + i];
-        if (idx >= charset_len) {
-            results[tid] = false;
-            return;
-        }
-        pwd[i] = charset[idx];
+    const int start = offsets[tid];
+    int len = offsets[tid + 1] - start;
+    if (len > 32) len = 32;
+
+    unsigned char pwd[32];
+    for (int i = 0; i < len; i++) {
+        pwd[i] = chars[start + i];
     }
-    
+
     // 这一步非常关键：模拟 AES 解密前的预处理
     // 在真实场景中，这里会进行 Key Derivation
-    
-    results[tid] = check_password((unsigned char*)pwd, pwd_len);
+
+    results[tid] = candidate_matches(pwd, len) ? 1 : 0;
+}
+
+// SoA（列主序）布局的定长候选校验：chars按 [pwd_len][batch_size]
+// 存放，warp内线程读取第j个字符时命中同一条128字节缓存行，
+// 访存完全合并；行主序布局下同样的读取是32次离散的1字节加载。
+__global__ void check_rar_password_soa(
+    const unsigned char* chars,
+    const int pwd_len,
+    const int batch_size,
+    unsigned char* results
+) {
+    const int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= batch_size) return;
+
+    unsigned char pwd[32];
+    for (int j = 0; j < pwd_len; j++) {
+        pwd[j] = chars[j * batch_size + tid];
+    }
+
+    results[tid] = candidate_matches(pwd, pwd_len) ? 1 : 0;
+}
+
+// 设备端候选生成：候选密码是64位线性索引的纯函数，
+// 没有必要在主机上物化后经过PCIe传输。每个线程对
+// start_idx + tid 做基数为charset_len的按位分解，直接在
+// 寄存器中生成候选并送入校验流程，每批次零H2D拷贝。
+__global__ void check_rar_password_indexed(
+    const unsigned long long start_idx,
+    const unsigned int batch_size,
+    const unsigned int charset_len,
+    const unsigned int pwd_len,
+    unsigned char* results
+) {
+    const unsigned int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= batch_size) return;
+
+    unsigned long long idx = start_idx + tid;
+    unsigned char pwd[32];
+    for (int i = pwd_len - 1; i >= 0; i--) {
+        pwd[i] = c_charset[idx % charset_len];
+        idx /= charset_len;
+    }
+
+    results[tid] = candidate_matches(pwd, pwd_len) ? 1 : 0;
+}
+
+// 两段式流水线：阶段A做密钥派生（PBKDF2，占绝大部分算力），
+// 阶段B做校验值比对。两段跑在不同的流上，用事件衔接——上一批
+// 的阶段B和下一批的阶段A在时间上重叠，还允许两段各按自己的
+// 寄存器压力选块配置。真实的PBKDF2轮次接入后负载比例约为
+// 32768:1，重叠收益随之增大。
+__global__ void pbkdf2_stage(
+    const unsigned long long start_idx,
+    const unsigned int batch_size,
+    const unsigned int charset_len,
+    const unsigned int pwd_len,
+    unsigned char* keys
+) {
+    const unsigned int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= batch_size) return;
+
+    unsigned long long idx = start_idx + tid;
+    unsigned char pwd[32];
+    for (int i = pwd_len - 1; i >= 0; i--) {
+        pwd[i] = c_charset[idx % charset_len];
+        idx /= charset_len;
+    }
+
+    // 演示负载：真实实现在这里跑 d_kdf_iters 次HMAC-SHA256，
+    // 结果是32字节密钥。演示版把校验结论写进密钥首字节。
+    keys[tid * 32] = candidate_matches(pwd, pwd_len) ? 1 : 0;
+}
+
+__global__ void verify_stage(
+    const unsigned char* keys,
+    const unsigned long long start_idx,
+    const unsigned int batch_size,
+    unsigned long long* out_hit
+) {
+    const unsigned int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= batch_size) return;
+
+    // 演示负载：真实实现用密钥做AES解密并与 d_check 比对。
+    // 命中通过单字上的atomicCAS上报（见brute_range的说明）。
+    if (keys[tid * 32]) {
+        atomicCAS(out_hit, 0xFFFFFFFFFFFFFFFFULL,
+                  (unsigned long long)(start_idx + tid));
+    }
+}
+
+// 设备端常驻式暴力搜索：主机只上传 (start_idx, count)，候选
+// 生成、密钥派生和校验全部在设备上完成。命中用8字节字上的
+// atomicCAS上报第一个命中的线性索引——绝大多数批次没有命中，
+// 把每批 batch_size*4 字节的结果位图D2H换成8字节，PCIe回传
+// 流量几乎归零。
+__global__ void brute_range(
+    const unsigned long long start_idx,
+    const unsigned int batch_size,
+    const unsigned int charset_len,
+    const unsigned int pwd_len,
+    unsigned long long* out_hit
+) {
+    const unsigned int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= batch_size) return;
+
+    unsigned long long idx = start_idx + tid;
+    unsigned char pwd[32];
+    for (int i = pwd_len - 1; i >= 0; i--) {
+        pwd[i] = c_charset[idx % charset_len];
+        idx /= charset_len;
+    }
+
+    if (candidate_matches(pwd, pwd_len)) {
+        atomicCAS(out_hit, 0xFFFFFFFFFFFFFFFFULL,
+                  (unsigned long long)(start_idx + tid));
+    }
+}
+
+// 字典年份变体检查：线程 t 映射到 (基础词, 变体) 对，
+// base_i = t / (num_years+1)，v = t % (num_years+1)。v==0 是
+// 原词本身，v>0 在寄存器里拼上 c_years 的第 v-1 行。上传的
+// 只有基础词表，变体在设备上合成。
+__global__ void check_rar_password_years(
+    const unsigned char* chars,
+    const int* offsets,
+    const int num_base,
+    const int num_years,
+    unsigned char* results
+) {
+    const int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= num_base * (num_years + 1)) return;
+
+    const int base_i = tid / (num_years + 1);
+    const int v = tid % (num_years + 1);
+
+    const int start = offsets[base_i];
+    int len = offsets[base_i + 1] - start;
+    if (len > 28) len = 28;  // 留4字节给年份后缀
+
+    unsigned char pwd[32];
+    for (int i = 0; i < len; i++) {
+        pwd[i] = chars[start + i];
+    }
+    if (v > 0) {
+        for (int d = 0; d < 4; d++) {
+            pwd[len + d] = c_years[(v - 1) * 4 + d];
+        }
+        len += 4;
+    }
+
+    results[tid] = candidate_matches(pwd, len) ? 1 : 0;
+}
+
+// 掩码版设备端暴力搜索：与brute_range同构，但每个位置查自己的
+// 常量内存字符集行做混合基数分解。分解顺序与主机侧
+// get_position_from_index一致（末位是最低位），命中索引可以在
+// 主机上用同一套逻辑还原出密码。
+__global__ void mask_brute_range(
+    const unsigned long long start_idx,
+    const unsigned int batch_size,
+    const unsigned int num_positions,
+    unsigned long long* out_hit
+) {
+    const unsigned int tid = blockIdx.x * blockDim.x + threadIdx.x;
+    if (tid >= batch_size) return;
+
+    unsigned long long idx = start_idx + tid;
+    unsigned char pwd[MASK_MAX_POSITIONS];
+    for (int pos = num_positions - 1; pos >= 0; pos--) {
+        const int len = c_mask_lens[pos];
+        pwd[pos] = c_mask_tables[pos * MASK_ROW_STRIDE + (int)(idx % len)];
+        idx /= len;
+    }
+
+    if (candidate_matches(pwd, num_positions)) {
+        atomicCAS(out_hit, 0xFFFFFFFFFFFFFFFFULL,
+                  (unsigned long long)(start_idx + tid));
+    }
 }
 
 } // extern "C"
@@ -86,34 +475,39 @@ __global__ void check_rar_password(
 # 掩码密码生成CUDA核函数
 MASK_PASSWORD_GENERATE_KERNEL = """
 // 用于生成掩码密码的CUDA核函数
+// 字符集打平成一段连续池子+前缀和偏移：char**的两次依赖加载
+// （先取指针再取字符）warp无法合并，主机端也省掉逐位置分配和
+// 指针数组封送——现在 pool = ''.join(charsets)、
+// offsets = np.cumsum([0]+lens)，一次拷贝上传
 extern "C" __global__ void generate_mask_passwords(
-    int* indices,           // 每个线程处理的索引
-    int num_indices,        // 索引数量
-    char** charsets,        // 每个位置的字符集
-    int* charset_lengths,   // 每个字符集的长度
-    int num_positions,      // 密码位置数
-    char* output_passwords, // 输出的密码数组
-    int* output_lengths     // 输出的密码长度数组
+    const int* indices,         // 每个线程处理的索引
+    int num_indices,            // 索引数量
+    const char* charset_pool,   // 所有位置的字符集（连续拼接）
+    const int* charset_offsets, // 每个位置在池中的起始偏移（前缀和）
+    const int* charset_lengths, // 每个字符集的长度
+    int num_positions,          // 密码位置数
+    char* output_passwords,     // 输出的密码数组
+    int* output_lengths         // 输出的密码长度数组
 ) {
     int idx = blockIdx.x * blockDim.x + threadIdx.x;
     if (idx >= num_indices) return;
-    
+
     int index = indices[idx];
     int output_pos = 0;
-    
+
     // 计算每个位置的字符
     for (int pos = 0; pos < num_positions; pos++) {
         // 计算当前位置的字符索引
         int charset_idx = index % charset_lengths[pos];
         index /= charset_lengths[pos];
-        
-        // 获取对应字符集中的字符
-        char c = charsets[pos][charset_idx];
-        
+
+        // 获取对应字符集中的字符：单次加载，无指针链
+        char c = charset_pool[charset_offsets[pos] + charset_idx];
+
         // 写入输出
         output_passwords[idx * num_positions + output_pos++] = c;
     }
-    
+
     // 设置密码长度
     output_lengths[idx] = output_pos;
 }
@@ -121,36 +515,33 @@ extern "C" __global__ void generate_mask_passwords(
 
 # 字典攻击CUDA核函数
 DICTIONARY_CHECK_KERNEL = """
+// 头部XOR是对所有候选都相同的标量：主机端用np.bitwise_xor.reduce
+// 折叠一次后经 get_global('c_header_xor') 上传，每个线程省掉一整个
+// header_size长度的串行全局内存循环
+__constant__ unsigned int c_header_xor;
+
 // 用于字典攻击的CUDA核函数
+// offsets是主机端一次cumsum得到的前缀和（num_passwords+1项）：
+// 线程直接索引自己的区间，不再对lengths[0..tid-1]逐项求和——
+// 那个求和在整个网格上是O(N^2)的访存
 extern "C" __global__ void check_dictionary_passwords(
-    char* passwords,         // 密码字符串数组（扁平化）
-    int* password_lengths,   // 每个密码的长度
+    const char* passwords,   // 密码字符串数组（扁平化）
+    const int* offsets,      // 每个密码的起始偏移（前缀和）
     int num_passwords,       // 密码数量
-    unsigned char* rar_header, // RAR文件头部数据
-    int header_size,         // 头部大小
     int* results             // 结果标志（0或1）
 ) {
     int idx = blockIdx.x * blockDim.x + threadIdx.x;
     if (idx >= num_passwords) return;
-    
-    // 逻辑与check_rar_password相同
-    // 获取当前密码的起始位置和长度
-    int password_start = 0;
-    for (int i = 0; i < idx; i++) {
-        password_start += password_lengths[i];
-    }
-    int password_length = password_lengths[idx];
-    
-    // 计算简化的校验和
-    unsigned int checksum = 0;
+
+    int password_start = offsets[idx];
+    int password_length = offsets[idx + 1] - password_start;
+
+    // 计算简化的校验和：只XOR自己的密码字节，头部部分用预折叠标量
+    unsigned int checksum = c_header_xor;
     for (int i = 0; i < password_length; i++) {
         checksum ^= passwords[password_start + i];
     }
-    
-    for (int i = 0; i < header_size; i++) {
-        checksum ^= rar_header[i];
-    }
-    
+
     // 检查校验和（模拟）
     results[idx] = (checksum == 0x5A52) ? 1 : 0;
 }
@@ -159,9 +550,10 @@ extern "C" __global__ void check_dictionary_passwords(
 # 年份组合CUDA核函数
 YEAR_COMBINE_KERNEL = """
 // 用于组合密码与年份的CUDA核函数
+// base_offsets同样是主机端cumsum的前缀和，O(1)定位基础密码
 extern "C" __global__ void combine_with_years(
-    char* base_passwords,    // 基础密码数组
-    int* base_lengths,       // 基础密码长度数组
+    const char* base_passwords, // 基础密码数组
+    const int* base_offsets,    // 基础密码起始偏移（前缀和）
     int num_passwords,       // 基础密码数量
     int* years,              // 年份数组
     int num_years,           // 年份数量
@@ -170,16 +562,13 @@ extern "C" __global__ void combine_with_years(
 ) {
     int idx = blockIdx.x * blockDim.x + threadIdx.x;
     if (idx >= num_passwords * num_years) return;
-    
+
     int password_idx = idx / num_years;
     int year_idx = idx % num_years;
-    
+
     // 获取基础密码
-    int base_start = 0;
-    for (int i = 0; i < password_idx; i++) {
-        base_start += base_lengths[i];
-    }
-    int base_length = base_lengths[password_idx];
+    int base_start = base_offsets[password_idx];
+    int base_length = base_offsets[password_idx + 1] - base_start;
     
     // 获取年份
     int year = years[year_idx];
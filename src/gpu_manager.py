@@ -28,10 +28,41 @@ except ImportError:
 import psutil
 
 from src.cuda_kernels import get_kernel_code
-from src.config import DEFAULT_THREADS_PER_BLOCK, DEFAULT_MAX_BLOCKS
+from src.config import DEFAULT_THREADS_PER_BLOCK
 
 logger = logging.getLogger(__name__)
 
+class GPUContext:
+    """把CUDA上下文的push/pop配对成with语句
+
+    用法::
+
+        with gpu_manager.activate(gpu_id):
+            ...  # 期间该GPU的上下文在栈顶
+
+    异常或提前return都会经过__exit__弹出上下文，不会把上下文栈
+    留在错误状态。
+    """
+
+    def __init__(self, context):
+        self._context = context
+        self._pushed = False
+
+    def __enter__(self):
+        # 已在栈顶则什么都不做：调用方先activate()一次后，块内的
+        # 每个alloc/copy/launch不再各付一对push/pop的driver调用，
+        # 整个批次只剩外层那一对
+        if cuda.Context.get_current() is not self._context:
+            self._context.push()
+            self._pushed = True
+        return self._context
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._pushed:
+            cuda.Context.pop()
+            self._pushed = False
+        return False
+
 class GPUManager:
     """
     GPU资源管理类，负责CUDA环境初始化、内存分配和多GPU协调
@@ -44,9 +75,15 @@ class GPUManager:
             gpu_ids (list): GPU设备ID列表
         """
         self.gpu_ids = gpu_ids
-        self.contexts = []
+        # 上下文按全局GPU ID做键：GPUManager([2])这类子集管理器里
+        # 按位置索引会把gpu_id=2当下标用，多卡的spawn工作进程
+        # （每进程一张卡）第一次push就越界
+        self.contexts = {}
         self.devices = []
-        
+        self.functions = {}
+        self.modules = {}
+        self.mem_pools = {}
+
         try:
             cuda.init()
         except cuda.Error:
@@ -57,24 +94,52 @@ class GPUManager:
         if device_count == 0:
             raise RuntimeError("未检测到CUDA设备")
             
+        # 设备属性按GPU缓存一份：get_attributes()每次调用都要走驱动
+        # 往返并重建整张属性字典，放在每批次路径上开销可观。名称和
+        # 计算能力同理，初始化时一并取好
+        self._launch_limits = {}
+        self._device_attrs = {}
+        self._device_names = {}
+        self._compute_caps = {}
+
         for gpu_id in gpu_ids:
             if gpu_id >= device_count:
                 raise ValueError(f"无效的GPU ID: {gpu_id}")
-            self.devices.append(cuda.Device(gpu_id))
+            device = cuda.Device(gpu_id)
+            self.devices.append(device)
+            attrs = device.get_attributes()
+            self._device_attrs[gpu_id] = attrs
+            self._device_names[gpu_id] = device.name()
+            self._compute_caps[gpu_id] = device.compute_capability()
+            self._launch_limits[gpu_id] = (
+                attrs[cuda.device_attribute.MAX_THREADS_PER_BLOCK],
+                attrs[cuda.device_attribute.MAX_GRID_DIM_X])
         
         logging.info(f"已初始化 {len(self.devices)} 个GPU设备")
 
-    def __enter__(self):
-        """上下文管理器入口"""
-        for device in self.devices:
+    def create_contexts(self):
+        """为每个受管GPU创建CUDA上下文（幂等）
+
+        __init__只做设备枚举和属性缓存，真正的上下文创建在这里：
+        编译核函数、分配内存之前必须先调用（with语句的__enter__
+        会代劳；直接持有GPUManager的调用方如CUDABackend.init
+        需要显式调用）。
+        """
+        for gpu_id, device in zip(self.gpu_ids, self.devices):
+            if gpu_id in self.contexts:
+                continue
             try:
                 context = device.make_context()
-                self.contexts.append(context)
+                self.contexts[gpu_id] = context
                 context.pop()
             except cuda.Error as e:
                 logging.error(f"创建CUDA上下文失败: {e}")
                 self.cleanup()
                 raise
+
+    def __enter__(self):
+        """上下文管理器入口"""
+        self.create_contexts()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -84,32 +149,51 @@ class GPUManager:
 
     def cleanup(self):
         """清理CUDA资源"""
+        # 先归还内存池持有的块，再detach上下文——顺序反了会在
+        # 关闭时触发已销毁上下文上的free崩溃
+        for pool in self.mem_pools.values():
+            try:
+                pool.free_held()
+            except Exception:
+                pass
+        self.mem_pools = {}
         while self.contexts:
             try:
-                context = self.contexts.pop()
+                _, context = self.contexts.popitem()
                 context.pop()
                 context.detach()
             except:
                 pass
 
-    def get_device(self, idx=0):
-        """获取指定索引的GPU设备"""
-        if idx >= len(self.devices):
-            raise ValueError(f"GPU索引 {idx} 超出范围")
-        return self.devices[idx]
-
-    def push_context(self, idx=0):
-        """推入指定GPU设备的上下文"""
-        if idx >= len(self.contexts):
-            raise ValueError(f"GPU索引 {idx} 超出范围")
-        self.contexts[idx].push()
-        return self.contexts[idx]
-        
-    def pop_context(self, idx=0):
-        """弹出指定GPU设备的上下文"""
-        if idx >= len(self.contexts):
-            raise ValueError(f"GPU索引 {idx} 超出范围")
-        return self.contexts[idx].pop()
+    def get_device(self, gpu_id):
+        """获取指定GPU ID的设备对象"""
+        if gpu_id not in self.gpu_ids:
+            raise ValueError(f"无效的GPU ID: {gpu_id}")
+        return self.devices[self.gpu_ids.index(gpu_id)]
+
+    def push_context(self, gpu_id):
+        """推入指定GPU的上下文"""
+        if gpu_id not in self.contexts:
+            raise ValueError(f"无效的GPU ID: {gpu_id}")
+        self.contexts[gpu_id].push()
+        return self.contexts[gpu_id]
+
+    def pop_context(self, gpu_id):
+        """弹出指定GPU的上下文"""
+        if gpu_id not in self.contexts:
+            raise ValueError(f"无效的GPU ID: {gpu_id}")
+        return self.contexts[gpu_id].pop()
+
+    def activate(self, gpu_id):
+        """返回激活指定GPU上下文的with语句管理器
+
+        push/pop成对出现靠人肉try/finally维持，漏一个pop就会把
+        错误的上下文留在栈顶，后续CUDA调用要么串行化要么直接
+        出错。with块保证配对，提前return和异常路径也不例外。
+        """
+        if gpu_id not in self.contexts:
+            raise ValueError(f"无效的GPU ID: {gpu_id}")
+        return GPUContext(self.contexts[gpu_id])
 
     def _compile_kernels(self, gpu_id):
         """
@@ -120,29 +204,70 @@ class GPUManager:
         """
         # 获取CUDA核函数代码
         kernel_codes = get_kernel_code()
-        
+
+        # 每线程默认流：传统默认流的隐式全设备同步会让不同Python
+        # 工作线程（如API的线程池）发出的核函数互相串行化；
+        # per-thread后各线程拥有独立默认流，真正并发。
+        # 注意该选项下同步memcpy按线程默认流排序——本仓库的热路径
+        # 全部走显式流的async拷贝，同步拷贝只出现在初始化。
+        nvcc_options = ['--default-stream=per-thread']
+
+        # 针对运行时SM架构生成代码：显式-arch让nvcc用上新架构的
+        # 指令（如LOP3.LUT三输入逻辑，SHA-256的位运算大户），而不是
+        # 退到保守的通用PTX；-Xptxas=-O3开满寄存器分配器优化，
+        # -lineinfo让Nsight Compute的热点能映射回源码行。
+        try:
+            major, minor = self._compute_caps[gpu_id]
+            nvcc_options += ['-arch=sm_%d%d' % (major, minor),
+                             '-Xptxas=-O3', '--restrict', '-lineinfo']
+        except cuda.Error:
+            pass
+
+        # 跨进程持久的编译缓存：pycuda按 (源码, 选项) 的哈希缓存
+        # 编译产物，选项里带着-arch所以天然按SM架构区分。默认缓存
+        # 放在会被清理的临时目录，这里固定到用户缓存目录，nvcc的
+        # 数秒编译只在首次运行（或内核/架构变化）时发生，之后的
+        # 进程启动直接加载缓存的cubin。
+        cache_dir = os.path.join(
+            os.path.expanduser('~'), '.cache', 'rapidrar', 'cuda')
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError:
+            cache_dir = None
+
         # 为这个GPU编译所有核函数
         self.functions[gpu_id] = {}
-        
+        self.modules[gpu_id] = {}
+
         # 激活此GPU的上下文
         self.contexts[gpu_id].push()
-        
+
         try:
-            # 编译RAR密码检查核函数
-            module = SourceModule(kernel_codes['rar_check'])
-            self.functions[gpu_id]['check_rar_password'] = module.get_function("check_rar_password")
-            
-            # 编译掩码生成核函数
-            module = SourceModule(kernel_codes['mask_generate'])
-            self.functions[gpu_id]['generate_mask_passwords'] = module.get_function("generate_mask_passwords")
-            
-            # 编译字典攻击核函数
-            module = SourceModule(kernel_codes['dict_check'])
-            self.functions[gpu_id]['check_dictionary_passwords'] = module.get_function("check_dictionary_passwords")
-            
-            # 编译年份组合核函数
-            module = SourceModule(kernel_codes['year_combine'])
-            self.functions[gpu_id]['combine_with_years'] = module.get_function("combine_with_years")
+            # 四段核函数源码拼成一个翻译单元，只调一次nvcc：冷启动
+            # 只付一次编译（或一次缓存查找），常量符号也都落在同一
+            # 个模块里。模块仍挂在'rar_check'键下——后端用这个键
+            # get_global上传字符集/盐值等常量
+            combined_source = '\n'.join([
+                kernel_codes['rar_check'],
+                kernel_codes['mask_generate'],
+                kernel_codes['dict_check'],
+                kernel_codes['year_combine'],
+            ])
+            module = SourceModule(combined_source, options=nvcc_options,
+                                  cache_dir=cache_dir)
+            self.modules[gpu_id]['rar_check'] = module
+            for name in ('check_rar_password',
+                         'check_rar_password_indexed',
+                         'check_rar_password_soa',
+                         'pbkdf2_stage',
+                         'verify_stage',
+                         'brute_range',
+                         'mask_brute_range',
+                         'check_rar_password_years',
+                         'generate_mask_passwords',
+                         'check_dictionary_passwords',
+                         'combine_with_years'):
+                self.functions[gpu_id][name] = module.get_function(name)
         finally:
             # 弹出上下文
             cuda.Context.pop()
@@ -157,12 +282,9 @@ class GPUManager:
         Returns:
             总内存和空闲内存元组 (total, free)，单位为字节
         """
-        self.contexts[gpu_id].push()
-        try:
+        with self.activate(gpu_id):
             free, total = cuda.mem_get_info()
             return total, free
-        finally:
-            cuda.Context.pop()
     
     def get_optimal_batch_size(self, gpu_id, item_size):
         """
@@ -184,20 +306,18 @@ class GPUManager:
         # 计算可以容纳的项目数量
         max_items = int(usable_memory / item_size)
         
-        # 确保批处理大小不超过硬件限制
-        device_props = self.devices[self.gpu_ids.index(gpu_id)].get_attributes()
-        max_threads = device_props[cuda.device_attribute.MAX_THREADS_PER_BLOCK]
-        max_grid_x = device_props[cuda.device_attribute.MAX_GRID_DIM_X]
+        # 确保批处理大小不超过硬件限制（属性在初始化时已缓存）
+        max_threads, max_grid_x = self._launch_limits[gpu_id]
         
         max_hw_items = max_threads * max_grid_x
         
         # 取较小值作为批处理大小上限
         max_batch = min(max_items, max_hw_items)
         
-        # 返回2的幂次方，方便GPU处理
-        power = int(np.log2(max_batch))
-        optimal_batch = 2 ** power
-        
+        # 返回2的幂次方，方便GPU处理：整数bit_length代替标量np.log2
+        power = max(1, int(max_batch).bit_length() - 1)
+        optimal_batch = 1 << power
+
         return optimal_batch
     
     def get_device_info(self, gpu_id):
@@ -211,39 +331,45 @@ class GPUManager:
             设备信息字典
         """
         device = self.devices[self.gpu_ids.index(gpu_id)]
+        attrs = self._device_attrs[gpu_id]
+        major, minor = self._compute_caps[gpu_id]
         return {
-            'name': device.name(),
-            'compute_capability': f"{device.compute_capability()[0]}.{device.compute_capability()[1]}",
+            'name': self._device_names[gpu_id],
+            'compute_capability': f"{major}.{minor}",
             'total_memory': device.total_memory(),
-            'clock_rate': device.get_attributes()[cuda.device_attribute.CLOCK_RATE],
-            'multiprocessor_count': device.get_attributes()[cuda.device_attribute.MULTIPROCESSOR_COUNT],
-            'max_threads_per_block': device.get_attributes()[cuda.device_attribute.MAX_THREADS_PER_BLOCK]
+            'clock_rate': attrs[cuda.device_attribute.CLOCK_RATE],
+            'multiprocessor_count': attrs[cuda.device_attribute.MULTIPROCESSOR_COUNT],
+            'max_threads_per_block': attrs[cuda.device_attribute.MAX_THREADS_PER_BLOCK]
         }
     
-    def get_optimal_block_config(self, gpu_id, num_items):
+    def get_optimal_block_config(self, gpu_id, num_items, threads_per_block=None):
         """
         获取最优的CUDA块和网格配置
-        
+
         Args:
             gpu_id: GPU ID
             num_items: 处理的项目数量
-            
+            threads_per_block: 调用方指定（如自动调优得到）的块线程数
+
         Returns:
             (block_size, grid_size) 元组
         """
-        device = self.devices[self.gpu_ids.index(gpu_id)]
-        max_threads = device.get_attributes()[cuda.device_attribute.MAX_THREADS_PER_BLOCK]
-        
-        # 使用默认线程数或设备最大值中的较小值
-        block_size = min(DEFAULT_THREADS_PER_BLOCK, max_threads)
-        
-        # 计算网格大小，确保能处理所有项目
+        max_threads, max_grid_dim = self._launch_limits[gpu_id]
+
+        # 使用指定/默认线程数或设备最大值中的较小值
+        block_size = min(threads_per_block or DEFAULT_THREADS_PER_BLOCK, max_threads)
+
+        # 计算网格大小，确保能处理所有项目。核函数都是一线程一候选
+        # （tid>=batch_size即返回），没有grid-stride循环，网格必须
+        # 完整覆盖批次——此前按DEFAULT_MAX_BLOCKS截断会让超出的尾部
+        # 候选永远不被检查，而进度照常前进，等于无声地漏扫键空间
         grid_size = (num_items + block_size - 1) // block_size
-        
-        # 不超过最大网格维度
-        max_grid_dim = device.get_attributes()[cuda.device_attribute.MAX_GRID_DIM_X]
-        grid_size = min(grid_size, max_grid_dim, DEFAULT_MAX_BLOCKS)
-        
+
+        # 硬件网格上限是真正的约束；超过时宁可报错也不能静默截断
+        if grid_size > max_grid_dim:
+            raise ValueError(
+                f"批次过大: 需要 {grid_size} 个线程块，超过设备上限 {max_grid_dim}")
+
         return (block_size, grid_size)
     
     def execute_kernel(self, gpu_id, kernel_name, *args, **kwargs):
@@ -259,41 +385,102 @@ class GPUManager:
         Returns:
             执行结果
         """
-        self.contexts[gpu_id].push()
-        
-        try:
+        with self.activate(gpu_id):
             # 获取核函数
             kernel_func = self.functions[gpu_id][kernel_name]
-            
-            # 执行核函数
+
+            # 执行核函数（stream为None时使用默认流）
+            stream = kwargs.get('stream')
             if 'block' in kwargs and 'grid' in kwargs:
-                kernel_func(*args, block=kwargs['block'], grid=kwargs['grid'])
+                kernel_func(*args, block=kwargs['block'], grid=kwargs['grid'], stream=stream)
             else:
                 # 如果未指定块和网格配置，使用默认值
                 num_items = kwargs.get('num_items', 1)
-                block_size, grid_size = self.get_optimal_block_config(gpu_id, num_items)
-                kernel_func(*args, block=(block_size, 1, 1), grid=(grid_size, 1))
-        
-        finally:
-            # 弹出上下文
-            cuda.Context.pop()
+                block_size, grid_size = self.get_optimal_block_config(
+                    gpu_id, num_items, kwargs.get('threads_per_block'))
+                kernel_func(*args, block=(block_size, 1, 1), grid=(grid_size, 1), stream=stream)
     
+    def create_stream(self, gpu_id):
+        """
+        在指定GPU上创建CUDA流
+
+        Args:
+            gpu_id: GPU ID
+
+        Returns:
+            CUDA流对象
+        """
+        with self.activate(gpu_id):
+            return cuda.Stream()
+
+    def allocate_pinned(self, gpu_id, shape, dtype=np.uint8, write_combined=False):
+        """
+        分配页锁定（pinned）主机内存
+
+        可分页内存的PCIe DMA带宽远低于页锁定内存，
+        批量H2D/D2H传输应始终通过页锁定缓冲区进行。
+
+        Args:
+            gpu_id: GPU ID
+            shape: 数组形状
+            dtype: NumPy数据类型
+            write_combined: 是否使用写合并内存（仅适合主机只写的H2D缓冲区）
+
+        Returns:
+            页锁定的NumPy数组
+        """
+        with self.activate(gpu_id):
+            flags = cuda.host_alloc_flags.PORTABLE
+            if write_combined:
+                flags |= cuda.host_alloc_flags.WRITECOMBINED
+            return cuda.pagelocked_empty(shape, dtype, mem_flags=flags)
+
+    def copy_to_device_async(self, gpu_id, host_array, device_mem, stream):
+        """
+        将页锁定主机数据异步复制到设备内存
+
+        Args:
+            gpu_id: GPU ID
+            host_array: 页锁定主机数组
+            device_mem: 设备内存对象
+            stream: CUDA流
+        """
+        with self.activate(gpu_id):
+            cuda.memcpy_htod_async(device_mem, host_array, stream)
+
+    def copy_from_device_async(self, gpu_id, device_mem, host_array, stream):
+        """
+        将设备内存数据异步复制到页锁定主机数组
+
+        Args:
+            gpu_id: GPU ID
+            device_mem: 设备内存对象
+            host_array: 页锁定主机数组
+            stream: CUDA流
+        """
+        with self.activate(gpu_id):
+            cuda.memcpy_dtoh_async(host_array, device_mem, stream)
+
     def allocate_memory(self, gpu_id, size):
         """
         在GPU上分配内存
-        
+
+        通过每GPU的DeviceMemoryPool分配：cuMemAlloc/cuMemFree是
+        全设备同步的驱动调用，池把释放的块按大小桶缓存，同尺寸的
+        重复请求零驱动开销。缓冲区扩容时旧块回池而不是真正free。
+
         Args:
             gpu_id: GPU ID
             size: 分配的字节数
-            
+
         Returns:
             CUDA设备内存对象
         """
-        self.contexts[gpu_id].push()
-        try:
-            return cuda.mem_alloc(size)
-        finally:
-            cuda.Context.pop()
+        with self.activate(gpu_id):
+            if gpu_id not in self.mem_pools:
+                from pycuda.tools import DeviceMemoryPool
+                self.mem_pools[gpu_id] = DeviceMemoryPool()
+            return self.mem_pools[gpu_id].allocate(size)
     
     def copy_to_device(self, gpu_id, host_array, device_mem):
         """
@@ -304,11 +491,8 @@ class GPUManager:
             host_array: 主机数组（NumPy数组）
             device_mem: 设备内存对象
         """
-        self.contexts[gpu_id].push()
-        try:
+        with self.activate(gpu_id):
             cuda.memcpy_htod(device_mem, host_array)
-        finally:
-            cuda.Context.pop()
     
     def copy_from_device(self, gpu_id, device_mem, host_array):
         """
@@ -319,11 +503,8 @@ class GPUManager:
             device_mem: 设备内存对象
             host_array: 主机数组（NumPy数组）
         """
-        self.contexts[gpu_id].push()
-        try:
+        with self.activate(gpu_id):
             cuda.memcpy_dtoh(host_array, device_mem)
-        finally:
-            cuda.Context.pop()
     
     def get_device_name(self, gpu_id):
         """获取指定GPU的设备名称
@@ -334,4 +515,4 @@ class GPUManager:
         """
         if gpu_id not in self.gpu_ids:
             raise ValueError(f"Invalid GPU ID: {gpu_id}")
-        return self.devices[self.gpu_ids.index(gpu_id)].name() 
\ No newline at end of file
+        return self._device_names[gpu_id] 
\ No newline at end of file
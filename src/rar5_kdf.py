@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+RAR5密钥派生 (PBKDF2-HMAC-SHA256)
+
+RAR5的密钥派生是纯SHA-256块压缩负载，走hashlib.pbkdf2_hmac即
+OpenSSL的汇编实现：在Ice Lake+/Zen架构上OpenSSL会在运行时自动
+分派到SHA-NI指令（~4-8倍于标量实现），无需本仓库维护C扩展。
+pbkdf2_hmac在计算期间释放GIL，所以批量派生用线程池即可吃满
+多核。
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# RAR5头部存储的是迭代次数的log2值，实际迭代数为 1 << lg2_count，
+# 默认 lg2_count = 15 即 32768 次
+RAR5_DEFAULT_LG2_COUNT = 15
+RAR5_KEY_LENGTH = 32
+
+_pool = None
+
+RAR5_SIGNATURE = b'Rar!\x1a\x07\x01\x00'
+
+# RAR5块类型
+RAR5_BLOCK_CRYPT = 4
+
+# 头部标志
+RAR5_HFL_EXTRA = 0x01
+RAR5_HFL_DATA = 0x02
+
+# 加密头标志
+RAR5_CHFL_CHECK = 0x01
+
+
+def _read_vint(buf, pos):
+    """读取RAR5变长整数，返回 (值, 新偏移)"""
+    value = 0
+    shift = 0
+    while pos < len(buf):
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    raise ValueError("截断的vint")
+
+
+def parse_rar5_encryption(rar_file, scan_limit=1 << 16):
+    """
+    解析RAR5档案的加密头，提取密钥派生参数
+
+    只在初始化时做一次：盐值、迭代次数和校验值之后常驻内存
+    （GPU后端会再上传到__constant__内存），批处理循环不再碰
+    档案文件。当前实现解析档案级加密头（头部加密的档案）；
+    找不到时返回None，调用方回退到逐候选验证。
+
+    Args:
+        rar_file: RAR文件路径
+        scan_limit: 扫描文件头部的最大字节数
+
+    Returns:
+        dict(salt=bytes16, iterations=int, check_value=bytes) 或 None
+    """
+    with open(rar_file, 'rb') as f:
+        data = f.read(scan_limit)
+    return parse_rar5_encryption_bytes(data)
+
+
+def parse_rar5_encryption_bytes(data):
+    """
+    从内存中的文件头字节解析加密头，语义同parse_rar5_encryption
+
+    API侧流式接收上传时只需要头部前缀即可判定，不必先落盘。
+    """
+    pos = data.find(RAR5_SIGNATURE)
+    if pos < 0:
+        return None
+    pos += len(RAR5_SIGNATURE)
+
+    try:
+        while pos + 7 < len(data):
+            cursor = pos + 4  # 跳过头部CRC32
+            header_size, cursor = _read_vint(data, cursor)
+            header_end = cursor + header_size
+            block_type, cursor = _read_vint(data, cursor)
+            block_flags, cursor = _read_vint(data, cursor)
+            data_size = 0
+            if block_flags & RAR5_HFL_EXTRA:
+                _, cursor = _read_vint(data, cursor)
+            if block_flags & RAR5_HFL_DATA:
+                data_size, cursor = _read_vint(data, cursor)
+
+            if block_type == RAR5_BLOCK_CRYPT:
+                _, cursor = _read_vint(data, cursor)  # 加密版本
+                crypt_flags, cursor = _read_vint(data, cursor)
+                lg2_count = data[cursor]
+                cursor += 1
+                salt = data[cursor:cursor + 16]
+                cursor += 16
+                check_value = b''
+                if crypt_flags & RAR5_CHFL_CHECK:
+                    check_value = data[cursor:cursor + 12]
+                if len(salt) < 16:
+                    return None
+                return {
+                    'salt': salt,
+                    'iterations': 1 << lg2_count,
+                    'check_value': check_value,
+                }
+
+            pos = header_end + data_size
+    except (ValueError, IndexError):
+        return None
+    return None
+
+
+def _get_pool():
+    """懒初始化批量派生用的线程池"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+
+def derive_key(password, salt, iterations=1 << RAR5_DEFAULT_LG2_COUNT):
+    """
+    派生单个RAR5 AES密钥
+
+    Args:
+        password: 密码字符串
+        salt: 16字节盐值
+        iterations: PBKDF2迭代次数
+
+    Returns:
+        32字节密钥
+    """
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'),
+                               salt, iterations, RAR5_KEY_LENGTH)
+
+
+def verify_password(password, salt, iterations, check_value):
+    """
+    用加密头的校验值在进程内判定密码
+
+    RAR5把密码校验值存为第 iterations+32 次PBKDF2迭代结果按8字节
+    XOR折叠后的前8字节。整个判定就是一次pbkdf2_hmac调用（OpenSSL
+    的SHA-NI热循环）加一次比较，不碰档案数据，也不经过rarfile的
+    子进程。校验值只有64位，命中后调用方应再做一次完整验证。
+
+    Args:
+        password: 候选密码字符串
+        salt: 16字节盐值
+        iterations: 加密头中的基础迭代次数
+        check_value: 加密头中的校验值（>=8字节）
+
+    Returns:
+        bool: 校验值是否匹配
+    """
+    if len(check_value) < 8:
+        return False
+    derived = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'),
+                                  salt, iterations + 32, RAR5_KEY_LENGTH)
+    folded = bytearray(8)
+    for i, byte in enumerate(derived):
+        folded[i % 8] ^= byte
+    return bytes(folded) == check_value[:8]
+
+
+def verify_passwords(passwords, salt, iterations, check_value):
+    """
+    批量校验值验证
+
+    每个候选是一条独立的PBKDF2流；hashlib在C层释放GIL，线程池
+    把这些流摊到所有物理核上，每核各自跑OpenSSL的SHA-NI热循环。
+    相比进程池省掉了pickle/IPC，这正是哈希受限负载的理想形态：
+    Python只做驱动，全部算力耗在C里。
+
+    Args:
+        passwords: 候选密码字符串序列
+        salt: 16字节盐值
+        iterations: 加密头中的基础迭代次数
+        check_value: 加密头中的校验值（>=8字节）
+
+    Returns:
+        第一个校验值匹配的密码，没有时返回None
+    """
+    if len(check_value) < 8:
+        return None
+    if len(passwords) <= 1:
+        for password in passwords:
+            if verify_password(password, salt, iterations, check_value):
+                return password
+        return None
+    pool = _get_pool()
+    results = pool.map(
+        lambda p: verify_password(p, salt, iterations, check_value), passwords)
+    for password, matched in zip(passwords, results):
+        if matched:
+            return password
+    return None
+
+
+def pbkdf2_hmac_sha256_batch(passwords, salt, iterations=1 << RAR5_DEFAULT_LG2_COUNT):
+    """
+    批量派生RAR5密钥
+
+    每个密码的派生在线程池中并行执行；由于hashlib在C层释放GIL，
+    吞吐量随核数线性扩展。
+
+    Args:
+        passwords: 密码字符串列表
+        salt: 16字节盐值
+        iterations: PBKDF2迭代次数
+
+    Returns:
+        与passwords等长的32字节密钥列表
+    """
+    if len(passwords) <= 1:
+        return [derive_key(p, salt, iterations) for p in passwords]
+    pool = _get_pool()
+    return list(pool.map(lambda p: derive_key(p, salt, iterations), passwords))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+libunrar的ctypes绑定
+
+rarfile库每验证一个密码都要fork一次unrar子进程，单次开销在
+几十毫秒量级；通过进程内的libunrar调用（RAROpenArchiveEx /
+RARSetPassword / RARProcessFile仅测试头部）可以把单次验证
+降到微秒级。库只dlopen一次并缓存。
+"""
+
+import os
+import ctypes
+import ctypes.util
+import platform
+import threading
+
+# RAROpenArchiveDataEx.OpenMode
+RAR_OM_LIST = 0
+RAR_OM_EXTRACT = 1
+
+# RARProcessFile操作码
+RAR_SKIP = 0
+RAR_TEST = 1
+RAR_EXTRACT = 2
+
+# 错误码
+ERAR_SUCCESS = 0
+ERAR_END_ARCHIVE = 10
+ERAR_BAD_DATA = 12
+ERAR_BAD_PASSWORD = 24
+ERAR_MISSING_PASSWORD = 22
+
+# RARHeaderDataEx.Flags（见unrar的dll.hpp）
+RHDF_ENCRYPTED = 0x04
+RHDF_DIRECTORY = 0x20
+
+_lib = None
+_lib_checked = False
+_lock = threading.Lock()
+
+
+class RAROpenArchiveDataEx(ctypes.Structure):
+    _fields_ = [
+        ('ArcName', ctypes.c_char_p),
+        ('ArcNameW', ctypes.c_wchar_p),
+        ('OpenMode', ctypes.c_uint),
+        ('OpenResult', ctypes.c_uint),
+        ('CmtBuf', ctypes.c_char_p),
+        ('CmtBufSize', ctypes.c_uint),
+        ('CmtSize', ctypes.c_uint),
+        ('CmtState', ctypes.c_uint),
+        ('Flags', ctypes.c_uint),
+        ('OpFlags', ctypes.c_uint),
+        ('CmtBufW', ctypes.c_wchar_p),
+        ('Reserved', ctypes.c_uint * 25),
+    ]
+
+
+class RARHeaderDataEx(ctypes.Structure):
+    _fields_ = [
+        ('ArcName', ctypes.c_char * 1024),
+        ('ArcNameW', ctypes.c_wchar * 1024),
+        ('FileName', ctypes.c_char * 1024),
+        ('FileNameW', ctypes.c_wchar * 1024),
+        ('Flags', ctypes.c_uint),
+        ('PackSize', ctypes.c_uint),
+        ('PackSizeHigh', ctypes.c_uint),
+        ('UnpSize', ctypes.c_uint),
+        ('UnpSizeHigh', ctypes.c_uint),
+        ('HostOS', ctypes.c_uint),
+        ('FileCRC', ctypes.c_uint),
+        ('FileTime', ctypes.c_uint),
+        ('UnpVer', ctypes.c_uint),
+        ('Method', ctypes.c_uint),
+        ('FileAttr', ctypes.c_uint),
+        ('CmtBuf', ctypes.c_char_p),
+        ('CmtBufSize', ctypes.c_uint),
+        ('CmtSize', ctypes.c_uint),
+        ('CmtState', ctypes.c_uint),
+        ('Reserved', ctypes.c_uint * 1024),
+    ]
+
+
+def _candidate_paths():
+    """按平台给出libunrar的常见位置"""
+    if platform.system() == 'Windows':
+        return ['unrar.dll', 'UnRAR.dll',
+                'C:\\Program Files\\WinRAR\\UnRAR.dll']
+    if platform.system() == 'Darwin':
+        return ['libunrar.dylib', '/usr/local/lib/libunrar.dylib']
+    return ['libunrar.so', '/usr/lib/libunrar.so',
+            '/usr/local/lib/libunrar.so', '/usr/lib/x86_64-linux-gnu/libunrar.so']
+
+
+def _load():
+    """dlopen一次libunrar并设置函数签名，失败时返回None"""
+    global _lib, _lib_checked
+    if _lib_checked:
+        return _lib
+    with _lock:
+        if _lib_checked:
+            return _lib
+        paths = []
+        found = ctypes.util.find_library('unrar')
+        if found:
+            paths.append(found)
+        paths.extend(_candidate_paths())
+        for path in paths:
+            try:
+                lib = ctypes.CDLL(path)
+            except OSError:
+                continue
+            try:
+                lib.RAROpenArchiveEx.restype = ctypes.c_void_p
+                lib.RAROpenArchiveEx.argtypes = [ctypes.POINTER(RAROpenArchiveDataEx)]
+                lib.RARCloseArchive.argtypes = [ctypes.c_void_p]
+                lib.RARReadHeaderEx.argtypes = [ctypes.c_void_p, ctypes.POINTER(RARHeaderDataEx)]
+                lib.RARProcessFile.argtypes = [ctypes.c_void_p, ctypes.c_int,
+                                               ctypes.c_char_p, ctypes.c_char_p]
+                lib.RARSetPassword.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+                lib.RARSetPassword.restype = None
+            except AttributeError:
+                continue
+            _lib = lib
+            break
+        _lib_checked = True
+    return _lib
+
+
+def is_available():
+    """libunrar是否可用"""
+    return _load() is not None
+
+
+def test_password(rar_file, password):
+    """
+    进程内验证单个密码
+
+    只对档案中第一个加密的普通文件做RAR_TEST（解密+CRC校验，
+    不落盘），不会fork子进程。目录和未加密条目对任何密码都会
+    "成功"，必须跳过——否则首个条目是目录的档案会接受一切候选。
+
+    Args:
+        rar_file: RAR文件路径
+        password: 候选密码字符串
+
+    Returns:
+        bool: 密码是否正确
+    """
+    lib = _load()
+    if lib is None:
+        raise RuntimeError("libunrar不可用")
+
+    open_data = RAROpenArchiveDataEx()
+    open_data.ArcName = os.fsencode(rar_file)
+    open_data.OpenMode = RAR_OM_EXTRACT
+
+    handle = lib.RAROpenArchiveEx(ctypes.byref(open_data))
+    if not handle or open_data.OpenResult != ERAR_SUCCESS:
+        return False
+
+    try:
+        lib.RARSetPassword(handle, password.encode('utf-8'))
+        header = RARHeaderDataEx()
+        while lib.RARReadHeaderEx(handle, ctypes.byref(header)) == ERAR_SUCCESS:
+            if (header.Flags & RHDF_DIRECTORY or
+                    not header.Flags & RHDF_ENCRYPTED):
+                if lib.RARProcessFile(handle, RAR_SKIP, None, None) != ERAR_SUCCESS:
+                    return False
+                continue
+            result = lib.RARProcessFile(handle, RAR_TEST, None, None)
+            # 第一个实际参与解密的文件就足以判定密码
+            return result == ERAR_SUCCESS
+        # 没有加密的普通文件可供判定
+        return False
+    finally:
+        lib.RARCloseArchive(handle)
+
+
+def test_passwords(rar_file, passwords):
+    """
+    进程内批量验证密码
+
+    密码绑定在档案句柄上，所以每次尝试都要重开句柄（开销是
+    微秒级的库调用，不是进程fork）；dlopen、函数签名和路径
+    编码在整个批次间复用。
+
+    Args:
+        rar_file: RAR文件路径
+        passwords: 候选密码字符串序列
+
+    Returns:
+        第一个正确的密码，全部失败时返回None
+    """
+    lib = _load()
+    if lib is None:
+        raise RuntimeError("libunrar不可用")
+
+    arc_name = os.fsencode(rar_file)
+    header = RARHeaderDataEx()
+    for password in passwords:
+        open_data = RAROpenArchiveDataEx()
+        open_data.ArcName = arc_name
+        open_data.OpenMode = RAR_OM_EXTRACT
+
+        handle = lib.RAROpenArchiveEx(ctypes.byref(open_data))
+        if not handle or open_data.OpenResult != ERAR_SUCCESS:
+            continue
+        try:
+            lib.RARSetPassword(handle, password.encode('utf-8'))
+            # 与test_password同一套跳过逻辑：目录和未加密条目
+            # 对任何密码都"成功"，只在首个加密普通文件上判定
+            while lib.RARReadHeaderEx(handle, ctypes.byref(header)) == ERAR_SUCCESS:
+                if (header.Flags & RHDF_DIRECTORY or
+                        not header.Flags & RHDF_ENCRYPTED):
+                    if lib.RARProcessFile(handle, RAR_SKIP, None, None) != ERAR_SUCCESS:
+                        break
+                    continue
+                if lib.RARProcessFile(handle, RAR_TEST, None, None) == ERAR_SUCCESS:
+                    return password
+                break
+        finally:
+            lib.RARCloseArchive(handle)
+    return None
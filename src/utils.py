@@ -6,11 +6,33 @@
 """
 
 import os
+import re
 import json
 import math
+import mmap
+import time
+import atexit
+import functools
 import itertools
+import threading
 from pathlib import Path
 
+import numpy as np
+
+from src.config import MASK_SYMBOLS
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 def format_speed(speed):
     """
     格式化速度显示
@@ -30,16 +52,101 @@ def format_speed(speed):
     else:
         return f"{speed/1000000000:.2f} G次/秒"
 
-def save_checkpoint(checkpoint_file, data):
+def _dump_checkpoint(data):
+    """序列化检查点数据为bytes（优先orjson，约10倍于json）"""
+    if HAS_ORJSON:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+# 落盘计数：fsync按次数抽样而不是每次都刷
+_checkpoint_write_count = 0
+
+def _write_checkpoint(checkpoint_file, data, fsync_every=10):
+    """原子写入：先写临时文件再os.replace，避免撕裂的检查点
+
+    os.replace保证读到的检查点要么是旧的要么是新的，永远不是半截；
+    fsync只每fsync_every次做一次——它只决定断电时最多回退几个
+    落盘周期，每次都刷会把节流省下的盘操作又还回去。
+    """
+    global _checkpoint_write_count
+    _checkpoint_write_count += 1
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(_dump_checkpoint(data))
+        if _checkpoint_write_count % fsync_every == 0:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, checkpoint_file)
+
+class _CheckpointWriter:
+    """后台检查点刷写器
+
+    前台每个批次只做一次浅拷贝+置脏标记（锁内几微秒），序列化和
+    落盘全部挪到守护线程里按间隔执行——破解循环彻底不碰磁盘。
+    相邻批次的N次更新合并成1次写盘，落盘走_write_checkpoint的
+    原子替换路径。进程退出时atexit兜底刷一次。
+    """
+
+    def __init__(self, flush_interval=5.0):
+        self._interval = flush_interval
+        self._lock = threading.Lock()
+        self._path = None
+        self._data = None
+        self._dirty = False
+        self._thread = None
+
+    def update(self, path, data, flush_interval=None):
+        """记录最新状态；首次调用时启动刷写线程"""
+        with self._lock:
+            self._path = path
+            # 浅拷贝：调用方之后改自己的dict不会撕裂正在序列化的快照
+            self._data = dict(data)
+            self._dirty = True
+            if flush_interval is not None:
+                self._interval = flush_interval
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._worker, daemon=True, name='checkpoint-writer')
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _worker(self):
+        while True:
+            time.sleep(self._interval)
+            self.flush()
+
+    def flush(self):
+        """把挂起的检查点立即写盘（刷写线程和中断/退出路径共用）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            path, data = self._path, self._data
+            self._dirty = False
+        _write_checkpoint(path, data)
+
+_checkpoint_writer = _CheckpointWriter()
+
+def save_checkpoint(checkpoint_file, data, force=False, flush_interval=5.0):
     """
     保存检查点
-    
+
+    每个批次都调用，但只更新内存中的最新状态，真正的序列化和
+    落盘由后台线程按flush_interval节流执行，崩溃最多丢失几秒
+    进度。退出前调用flush_checkpoint()（或传force=True）确保落盘。
+
     Args:
         checkpoint_file: 检查点文件路径
         data: 要保存的数据
+        force: 跳过节流立即写盘
+        flush_interval: 后台两次落盘之间的间隔（秒）
     """
-    with open(checkpoint_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+    _checkpoint_writer.update(checkpoint_file, data, flush_interval)
+    if force:
+        _checkpoint_writer.flush()
+
+def flush_checkpoint():
+    """把挂起的检查点立即写盘（在中断/退出路径调用）"""
+    _checkpoint_writer.flush()
 
 def load_checkpoint(checkpoint_file):
     """
@@ -52,10 +159,111 @@ def load_checkpoint(checkpoint_file):
         加载的检查点数据
     """
     if os.path.exists(checkpoint_file):
-        with open(checkpoint_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # 与_dump_checkpoint对称：读bytes，优先orjson解析
+        with open(checkpoint_file, 'rb') as f:
+            payload = f.read()
+        if HAS_ORJSON:
+            return orjson.loads(payload)
+        return json.loads(payload)
     return {}
 
+@functools.lru_cache(maxsize=64)
+def length_prefix_sums(charset_len, min_length, max_length):
+    """
+    计算各密码长度的组合数前缀和（缓存）
+
+    返回元组 (0, n^min, n^min + n^(min+1), ...)，末项即总组合数。
+    批处理器可以用 bisect(prefix, global_idx) 在O(log L)内把线性
+    索引映射回 (长度, 长度内偏移)，而不用循环累乘。
+
+    Args:
+        charset_len: 字符集大小
+        min_length: 最小密码长度
+        max_length: 最大密码长度
+
+    Returns:
+        前缀和元组，长度为 max_length - min_length + 2
+    """
+    prefix = [0]
+    for length in range(min_length, max_length + 1):
+        prefix.append(prefix[-1] + math.prod([charset_len] * length))
+    return tuple(prefix)
+
+def _power_series_sum(charset_len, lo, hi):
+    """
+    计算 charset_len^lo + ... + charset_len^hi 的闭式等比求和
+
+    (L^(hi+1) - L^lo) // (L-1) 只要两次大整数幂和一次减法除法，
+    比逐长度循环累加独立的 ** 快——长度区间大时尤其明显。
+
+    Args:
+        charset_len: 字符集大小（公比）
+        lo: 最小指数
+        hi: 最大指数（含）
+
+    Returns:
+        等比数列和，区间为空时返回0
+    """
+    if hi < lo:
+        return 0
+    if charset_len == 1:
+        return hi - lo + 1
+    return (pow(charset_len, hi + 1) - pow(charset_len, lo)) // (charset_len - 1)
+
+def _count_dict_lines(dict_file):
+    """
+    统计字典文件的行数，结果缓存在旁路文件里
+
+    扫描本身是二进制分块读并数\\n——bytes.count在C里走向量化的
+    memchr，不解码也不逐行分配Python对象。多GB词表扫一遍仍要数秒
+    而UI/API每次破解前都要估算，所以结果按 (mtime_ns, size) 缓存
+    到 <dict>.count，文件没变时是一次O(1)的stat+读取。
+    """
+    cache_path = dict_file + '.count'
+    try:
+        st = os.stat(dict_file)
+        key = [st.st_mtime_ns, st.st_size]
+    except OSError:
+        key = None
+
+    if key is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = json.loads(f.read())
+            if cached.get('key') == key:
+                return cached['count']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    count = 0
+    tail = b'\n'
+    with open(dict_file, 'rb') as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            count += chunk.count(b'\n')
+            tail = chunk[-1:]
+    if tail != b'\n':
+        # 最后一行没有换行符
+        count += 1
+
+    if key is not None:
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'count': count}, f)
+        except OSError:
+            # 词表所在目录只读时退化为每次重扫
+            pass
+    return count
+
+# 掩码分词与各符号的字符集长度，模块导入时算好一次。分词只认
+# MASK_SYMBOLS里实际存在的?X：无效的?X和parse_mask一样按字面量
+# ?加普通字符处理，否则估算和真实枚举空间对不上
+_MASK_TOKEN_RE = re.compile(
+    '|'.join(re.escape(sym) for sym in MASK_SYMBOLS) + '|.')
+_MASK_SYMBOL_LENS = {sym: len(cs) for sym, cs in MASK_SYMBOLS.items()}
+
 def estimate_combinations(charset, min_length, max_length, mask=None, dict_file=None, use_years=False):
     """
     估算可能的密码组合数量
@@ -73,82 +281,174 @@ def estimate_combinations(charset, min_length, max_length, mask=None, dict_file=
     """
     if dict_file:
         # 字典攻击，统计字典文件中的行数
-        count = sum(1 for _ in open(dict_file, 'r', encoding='utf-8', errors='ignore'))
-        
+        count = _count_dict_lines(dict_file)
+
         # 如果使用年份，需要乘以年份数量
         if use_years:
             count *= (2026 - 2020)
-            
+
         return count
     
     elif mask:
-        # 掩码攻击
-        from src.config import MASK_SYMBOLS
-        
-        # 解析掩码
-        combinations = 1
-        i = 0
-        while i < len(mask):
-            if mask[i] == '?' and i + 1 < len(mask):
-                symbol = mask[i:i+2]
-                if symbol in MASK_SYMBOLS:
-                    combinations *= len(MASK_SYMBOLS[symbol])
-                    i += 2
-                    continue
-            # 如果不是掩码符号，只有一种可能
-            combinations *= 1
-            i += 1
-        
-        return combinations
+        # 掩码攻击：一次正则分词（?X或单个字符），再对各符号的
+        # 字符集长度连乘——不再逐字符走Python分支
+        tokens = _MASK_TOKEN_RE.findall(mask)
+        return math.prod(_MASK_SYMBOL_LENS.get(t, 1) for t in tokens)
     
     else:
-        # 暴力破解
-        total = 0
+        # 暴力破解：闭式等比求和，O(1)而不是逐长度循环累加
         charset_len = len(charset)
-        
-        for length in range(min_length, max_length + 1):
-            total += charset_len ** length
-        
+        total = _power_series_sum(charset_len, min_length, max_length)
+
         # 如果使用年份，添加额外的组合
         if use_years:
-            years_combinations = 0
             years_count = 2026 - 2020
-            
-            # 估算含年份的组合数量（简化计算）
-            for length in range(min_length - 4, max_length - 3):  # 减去年份长度
-                if length >= 1:  # 至少有一个其他字符
-                    years_combinations += charset_len ** length * years_count
-            
-            total += years_combinations
-        
+
+            # 估算含年份的组合数量（简化计算）：长度减去年份的4位，
+            # 剩余部分至少1个字符，同样走闭式求和
+            total += years_count * _power_series_sum(
+                charset_len, max(1, min_length - 4), max_length - 4)
+
         return total
 
+def charset_to_array(charset):
+    """
+    将字符集字符串转换为uint8数组
+
+    数组形式的字符集可以直接用于NumPy花式索引和GPU上传，
+    避免逐字符的Python级别操作。
+
+    Args:
+        charset: 字符集字符串（ASCII）或预编码的bytes
+
+    Returns:
+        np.uint8数组
+    """
+    if isinstance(charset, str):
+        charset = charset.encode('ascii')
+    return np.frombuffer(charset, dtype=np.uint8)
+
+if HAS_NUMBA:
+    @njit(cache=True, parallel=True)
+    def _candidate_decompose_jit(charset_arr, start_idx, out):
+        # prange把行分给所有核：批次生成从单核NumPy生产者变成
+        # 并行生产者，每行在寄存器里做完整的基数分解
+        batch_size, length = out.shape
+        base = np.uint64(charset_arr.size)
+        for r in prange(batch_size):
+            idx = start_idx + np.uint64(r)
+            for col in range(length - 1, -1, -1):
+                out[r, col] = charset_arr[idx % base]
+                idx //= base
+        return out
+
+def fill_candidate_matrix(charset_arr, length, start_idx, out):
+    """
+    向量化生成一批候选密码，写入预分配的(batch, length)矩阵
+
+    把 [start_idx, start_idx + batch) 区间的线性索引做基数为
+    len(charset) 的按位分解。装了numba时是一遍并行（prange）的
+    编译循环；否则每一列一次NumPy花式索引，同样没有逐候选的
+    Python循环。out 可以是页锁定缓冲区的切片，这样生成结果直接
+    落在H2D暂存区中。
+
+    Args:
+        charset_arr: uint8字符集数组（见charset_to_array）
+        length: 密码长度
+        start_idx: 起始线性索引
+        out: 预分配的(batch_size, length) uint8输出矩阵
+
+    Returns:
+        填充后的out
+    """
+    if HAS_NUMBA:
+        return _candidate_decompose_jit(charset_arr, np.uint64(start_idx), out)
+
+    base = np.uint64(len(charset_arr))
+    batch_size = out.shape[0]
+    idx = np.arange(start_idx, start_idx + batch_size, dtype=np.uint64)
+    # 高位在前，与generate_password_batch的字符顺序一致
+    for col in range(length - 1, -1, -1):
+        out[:, col] = charset_arr[(idx % base).astype(np.intp)]
+        idx //= base
+    return out
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _mask_decompose_jit(tables, lens, start_idx, out):
+        # 单遍混合基数分解：numba把双层整数循环编译成机器码，
+        # 不再为每列分配 idx%base / idx//base 的临时数组
+        batch_size, num_positions = out.shape
+        for r in range(batch_size):
+            idx = start_idx + r
+            for col in range(num_positions - 1, -1, -1):
+                base = lens[col]
+                out[r, col] = tables[col, idx % base]
+                idx //= base
+        return out
+
+def fill_mask_matrix(charsets, start_idx, out):
+    """
+    向量化生成一批掩码候选，写入预分配的(batch, positions)矩阵
+
+    掩码每个位置有自己的字符集，线性索引按混合基数分解：末位是
+    最低位（与get_position_from_index一致）。装了numba时整个分解
+    是一遍编译后的双层循环；否则退回按列的NumPy路径——每列一次
+    整除/取模加一次花式索引，同样没有逐候选的Python循环。
+
+    Args:
+        charsets: 字符集列表（每个位置一个str，定长位置为单字符）
+        start_idx: 起始线性索引
+        out: 预分配的(batch_size, len(charsets)) uint8输出矩阵
+
+    Returns:
+        填充后的out
+    """
+    if HAS_NUMBA:
+        max_len = max(len(cs) for cs in charsets)
+        tables = np.zeros((len(charsets), max_len), dtype=np.uint8)
+        lens = np.empty(len(charsets), dtype=np.int64)
+        for col, cs in enumerate(charsets):
+            arr = charset_to_array(cs)
+            tables[col, :arr.size] = arr
+            lens[col] = arr.size
+        return _mask_decompose_jit(tables, lens, np.uint64(start_idx), out)
+
+    batch_size = out.shape[0]
+    idx = np.arange(start_idx, start_idx + batch_size, dtype=np.uint64)
+    for col in range(len(charsets) - 1, -1, -1):
+        cs_arr = charset_to_array(charsets[col])
+        base = np.uint64(len(cs_arr))
+        out[:, col] = cs_arr[(idx % base).astype(np.intp)]
+        idx //= base
+    return out
+
 def generate_password_batch(charset, length, start_idx, batch_size):
     """
     生成一批特定长度的密码
-    
+
+    基数分解走fill_candidate_matrix的向量化路径（numba时是并行的
+    编译循环，否则按列的NumPy花式索引），字符串物化整批一次
+    decode后切片——没有逐候选、逐字符的Python解释器循环。
+
     Args:
         charset: 字符集
         length: 密码长度
         start_idx: 起始索引
         batch_size: 批量大小
-        
+
     Returns:
         生成的密码列表
     """
     charset_len = len(charset)
-    passwords = []
-    
-    for i in range(start_idx, min(start_idx + batch_size, charset_len ** length)):
-        # 将索引转换为基于字符集的数字系统
-        password = []
-        idx = i
-        for _ in range(length):
-            password.append(charset[idx % charset_len])
-            idx //= charset_len
-        passwords.append(''.join(reversed(password)))
-    
-    return passwords
+    count = min(start_idx + batch_size, charset_len ** length) - start_idx
+    if count <= 0:
+        return []
+
+    matrix = np.empty((count, length), dtype=np.uint8)
+    fill_candidate_matrix(charset_to_array(charset), length, start_idx, matrix)
+    text = matrix.tobytes().decode('ascii')
+    return [text[k * length:(k + 1) * length] for k in range(count)]
 
 def parse_mask(mask, charset_map):
     """
@@ -188,10 +488,13 @@ def get_position_from_index(index, charset_lengths):
     Returns:
         位置数组，表示每个位置的字符索引
     """
-    position = []
-    for length in reversed(charset_lengths):
-        position.insert(0, index % length)
-        index //= length
+    # 预分配后倒序填充：insert(0, ...)每次都要整体后移，循环
+    # 下来是O(n^2)的memmove
+    n = len(charset_lengths)
+    position = [0] * n
+    for k in range(n - 1, -1, -1):
+        position[k] = index % charset_lengths[k]
+        index //= charset_lengths[k]
     return position
 
 def get_index_from_position(position, charset_lengths):
@@ -210,30 +513,85 @@ def get_index_from_position(position, charset_lengths):
         index = index * charset_lengths[i] + pos
     return index
 
-def calculate_work_division(total_combinations, num_gpus):
+@functools.lru_cache(maxsize=64)
+def mask_place_values(charset_lengths):
+    """
+    计算掩码各位置的位权（缓存）
+
+    bases[i] = 位置i+1之后所有字符集长度的连乘，即位置i上+1对应
+    线性索引增加多少。掩码解析一次后反复做索引↔位置转换时不必
+    每次重新累乘。
+
+    Args:
+        charset_lengths: 字符集长度元组（lru_cache要求可哈希）
+
+    Returns:
+        位权元组，与charset_lengths等长，末项恒为1
+    """
+    n = len(charset_lengths)
+    bases = [1] * n
+    for i in range(n - 2, -1, -1):
+        bases[i] = bases[i + 1] * charset_lengths[i + 1]
+    return tuple(bases)
+
+def positions_from_index_range(start_idx, count, charset_lengths):
+    """
+    批量把连续索引区间转换为位置矩阵
+
+    逐索引调用get_position_from_index是每个候选n次Python级
+    divmod；这里用缓存的位权做一次 (index // bases) % lengths
+    的NumPy广播，整批只有两次向量化整除/取模。索引超出int64
+    时（掩码空间>2^63，实际枚举不到）调用方退回逐索引路径。
+
+    Args:
+        start_idx: 区间起始线性索引
+        count: 索引数量
+        charset_lengths: 每个位置的字符集长度列表
+
+    Returns:
+        (count, n) 的int64位置矩阵
+    """
+    bases = np.asarray(mask_place_values(tuple(charset_lengths)), dtype=np.int64)
+    lengths = np.asarray(charset_lengths, dtype=np.int64)
+    indices = np.arange(start_idx, start_idx + count, dtype=np.int64)
+    return (indices[:, None] // bases) % lengths
+
+def calculate_work_division(total_combinations, num_gpus, block_multiple=1,
+                            weights=None):
     """
     计算工作在多个GPU之间的分配
-    
+
     Args:
         total_combinations: 总组合数
         num_gpus: GPU数量
-        
+        block_multiple: 区间边界对齐到的粒度（如核函数的线程块
+            大小）。不对齐时每张卡的最后一个网格都带一个吃不满
+            线程块的碎尾巴；对齐后只有整个搜索空间的末尾有
+        weights: 各GPU的相对吞吐权重列表，按比例切分（None为均分，
+            异构多卡时可用预热基准的速度作为权重）
+
     Returns:
-        每个GPU的工作区间列表 [(start1, end1), (start2, end2), ...]
+        每个GPU的工作区间列表 [(start1, end1), (start2, end2), ...]，
+        区间首尾相接覆盖整个空间
     """
-    base_size = total_combinations // num_gpus
-    remainder = total_combinations % num_gpus
-    
+    if weights is None:
+        weights = [1] * num_gpus
+    total_weight = sum(weights)
+
     divisions = []
     start = 0
-    
     for i in range(num_gpus):
-        # 前remainder个GPU多分配一个任务
-        size = base_size + (1 if i < remainder else 0)
-        end = start + size
+        if i == num_gpus - 1:
+            # 余数（含对齐丢掉的尾数）归最后一张卡
+            end = total_combinations
+        else:
+            size = total_combinations * weights[i] // total_weight
+            if block_multiple > 1:
+                size -= size % block_multiple
+            end = min(total_combinations, start + size)
         divisions.append((start, end))
         start = end
-    
+
     return divisions
 
 def chunks(iterable, size):
@@ -247,9 +605,51 @@ def chunks(iterable, size):
     Returns:
         生成器，每次生成一个块
     """
+    # 支持len+切片的输入（list/bytes/ndarray）直接按区间切：
+    # ndarray切片是零拷贝视图，也不走逐元素的Python迭代
+    if hasattr(iterable, '__len__') and hasattr(iterable, '__getitem__'):
+        for i in range(0, len(iterable), size):
+            yield iterable[i:i + size]
+        return
+
     it = iter(iterable)
     while True:
         chunk = list(itertools.islice(it, size))
         if not chunk:
             break
-        yield chunk 
\ No newline at end of file
+        yield chunk
+
+def file_chunks(path, size):
+    """
+    按字节块流式读取文件，块边界对齐到下一个换行符
+
+    mmap映射后按区间切bytes：不解码、没有逐行的Python对象——
+    文本迭代器版的chunks每个元素都是一个str，这里每块只有一次
+    内存拷贝。调用方在块内按需分行（splitlines走C）。换行符扫描
+    用mm.find（C的memchr），不逐字节走Python。
+
+    Args:
+        path: 文件路径
+        size: 目标块大小（字节），实际块延伸到size后的首个\\n
+
+    Yields:
+        bytes块，不含块间的换行符
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件
+            return
+    try:
+        total = len(mm)
+        start = 0
+        while start < total:
+            end = mm.find(b'\n', min(start + size, total))
+            if end < 0:
+                # 文件结尾：末块同样不带结尾换行符
+                end = total - 1 if mm[total - 1:total] == b'\n' else total
+            yield mm[start:end]
+            start = end + 1
+    finally:
+        mm.close()
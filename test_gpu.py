@@ -9,18 +9,20 @@ import os
 import time
 import argparse
 import numpy as np
-import pycuda.driver as cuda
-import cupy as cp
 import traceback
 import logging
 
-from src.gpu_manager import GPUManager
 from src.config import DEFAULT_CHARSET
 
+# pycuda/cupy在各函数内按需导入：模块级导入要1-3秒并触发CUDA
+# 驱动初始化，连 --help 和无GPU机器上的快速失败都要陪着等
+
 def test_gpu_detection():
     """测试GPU检测功能"""
+    import pycuda.driver as cuda
+
     print("测试GPU检测功能...")
-    
+
     # 初始化CUDA
     cuda.init()
     
@@ -44,6 +46,9 @@ def test_gpu_detection():
     return gpu_count
 
 def test_password_generation(gpu_id, batch_size, length):
+    import pycuda.driver as cuda
+    import cupy as cp
+
     print(f"\n在GPU {gpu_id} 上测试密码生成性能...")
     try:
         # 初始化 GPU
@@ -62,50 +67,124 @@ def test_password_generation(gpu_id, batch_size, length):
         
         # GPU 测试
         with cp.cuda.Device(gpu_id):  # 确保在正确的GPU上执行
-            # 将数据传输到GPU
+            # 缓冲区只分配一次，循环内复用：现场cudaMalloc/Free
+            # 会和核函数串行化，测出来的是分配器而不是生成速度
+            charset_array = cp.asarray(
+                np.frombuffer(DEFAULT_CHARSET.encode('ascii'), dtype=np.uint8))
+            gpu_indices = cp.empty(indices.shape, dtype=cp.int32)
+            gpu_passwords = cp.empty(indices.shape, dtype=cp.uint8)
+
+            # 预热一轮：触发ElementwiseKernel编译和内存池首次分配，
+            # 不计入测量
+            gpu_indices.set(indices)
+            generate_passwords_gpu(gpu_indices, charset_array, out=gpu_passwords)
+            cp.cuda.stream.get_current_stream().synchronize()
+
+            iterations = 5
             start_time = time.time()
-            gpu_indices = cp.asarray(indices)
-            charset_array = cp.array([ord(c) for c in DEFAULT_CHARSET], dtype=cp.int32)
-            
-            # 生成密码
-            gpu_passwords = generate_passwords_gpu(gpu_indices, charset_array)
+            for _ in range(iterations):
+                gpu_indices.set(indices)
+                generate_passwords_gpu(gpu_indices, charset_array,
+                                       out=gpu_passwords)
             cp.cuda.stream.get_current_stream().synchronize()
-            gpu_time = time.time() - start_time
+            gpu_time = (time.time() - start_time) / iterations
             gpu_speed = batch_size / gpu_time
-            
-            # 将结果转换回字符串
-            gpu_results = cp.asnumpy(gpu_passwords)
-            gpu_str_passwords = np.array([[chr(c) for c in row] for row in gpu_results[:10]])
-        
-        # 验证结果
-        cpu_results = cpu_passwords[:10]
+
+            # 三重缓冲流水线：批次切成子批，3个流轮转各自的一套
+            # 页锁定主机+设备缓冲——每个流上依次排队H2D、核函数、
+            # D2H，拷贝引擎与计算引擎重叠，总时间趋近三段中最长的
+            # 一段而不是三段之和
+            num_chunks = 6
+            sub = (batch_size + num_chunks - 1) // num_chunks
+            streams = [cp.cuda.Stream(non_blocking=True) for _ in range(3)]
+            d_idx = [cp.empty((sub, length), cp.int32) for _ in range(3)]
+            d_out = [cp.empty((sub, length), cp.uint8) for _ in range(3)]
+            h_idx, h_out = [], []
+            for _ in range(3):
+                # 可分页内存的set/get会退化为同步拷贝，必须页锁定
+                pinned = cp.cuda.alloc_pinned_memory(sub * length * 4)
+                h_idx.append(np.frombuffer(pinned, np.int32,
+                                           sub * length).reshape(sub, length))
+                pinned = cp.cuda.alloc_pinned_memory(sub * length)
+                h_out.append(np.frombuffer(pinned, np.uint8,
+                                           sub * length).reshape(sub, length))
+
+            start_time = time.time()
+            for k in range(num_chunks):
+                lo = k * sub
+                hi = min(batch_size, lo + sub)
+                slot = k % 3
+                # 覆写该槽位的主机缓冲前等它上一轮的工作排空
+                streams[slot].synchronize()
+                n = hi - lo
+                h_idx[slot][:n] = indices[lo:hi]
+                with streams[slot]:
+                    d_idx[slot][:n].set(h_idx[slot][:n])
+                    generate_passwords_gpu(d_idx[slot][:n], charset_array,
+                                           out=d_out[slot][:n])
+                    d_out[slot][:n].get(out=h_out[slot][:n])
+            for s in streams:
+                s.synchronize()
+            pipeline_speed = batch_size / (time.time() - start_time)
+
+            # 将结果转换回字符串：uint8字节直接重解释为定宽S串，
+            # 一次memcpy；逐单元chr()的双层循环在大批次下比生成
+            # 本身还慢
+            gpu_results = cp.asnumpy(gpu_passwords[:10])
+            gpu_str_passwords = np.frombuffer(
+                np.ascontiguousarray(gpu_results).tobytes(), dtype=f'|S{length}')
+
+        # 验证结果（CPU侧同样转成定宽字节串比较）
+        cpu_results = np.frombuffer(
+            cpu_passwords[:10].tobytes(), dtype=f'|S{length}')
         match = np.array_equal(cpu_results, gpu_str_passwords)
         
         print(f"\nCPU 速度: {cpu_speed:.2f} 密码/秒")
         print(f"GPU 速度: {gpu_speed:.2f} 密码/秒")
+        print(f"GPU 流水线速度（含D2H）: {pipeline_speed:.2f} 密码/秒")
         print(f"加速比: {gpu_speed/cpu_speed:.2f}x")
         print(f"结果验证: {'通过' if match else '失败'}")
         
         if not match:
             print("\n前10个密码比较:")
-            print("CPU:", [''.join(p) for p in cpu_results])
-            print("GPU:", [''.join(p) for p in gpu_str_passwords])
+            print("CPU:", [p.decode('ascii') for p in cpu_results])
+            print("GPU:", [p.decode('ascii') for p in gpu_str_passwords])
         
     except Exception as e:
         print(f"测试过程中出错: {str(e)}")
         traceback.print_exc()
 
-def generate_passwords_gpu(indices, charset_array):
-    """在GPU上生成密码"""
-    return charset_array[indices]
+# 懒构造并复用：ElementwiseKernel首次调用时编译一次
+_GEN_PW_KERNEL = None
+
+def generate_passwords_gpu(indices, charset_array, out=None):
+    """在GPU上生成密码
+
+    单个ElementwiseKernel按索引取uint8字符直接写输出：通用的
+    fancy-indexing gather要走int32中间数组（4字节/字符），这里
+    输出流量降到1字节/字符，也少一次核函数启动和一次分配。
+    传入out时复用调用方的缓冲区，循环内零分配。
+    """
+    import cupy as cp
+
+    global _GEN_PW_KERNEL
+    if _GEN_PW_KERNEL is None:
+        _GEN_PW_KERNEL = cp.ElementwiseKernel(
+            'int32 idx, raw uint8 cs', 'uint8 out',
+            'out = cs[idx];', 'gen_pw_gather')
+    if out is None:
+        out = cp.empty(indices.shape, dtype=cp.uint8)
+    _GEN_PW_KERNEL(indices, charset_array, out)
+    return out
 
 def generate_passwords_cpu(indices):
-    """在CPU上生成密码"""
-    passwords = np.empty((indices.shape[0], indices.shape[1]), dtype='U1')
-    for i in range(indices.shape[0]):
-        for j in range(indices.shape[1]):
-            passwords[i, j] = DEFAULT_CHARSET[indices[i, j]]
-    return passwords
+    """在CPU上生成密码
+
+    和GPU版一样的一次花式索引：逐单元的双层Python循环在百万级
+    batch_size下要跑数秒，把CPU基准压得虚低。
+    """
+    charset_array = np.frombuffer(DEFAULT_CHARSET.encode('ascii'), dtype='S1')
+    return charset_array[indices]
 
 def main():
     """主函数"""
@@ -118,7 +197,14 @@ def main():
     
     print("GPU加速测试工具")
     print("=" * 60)
-    
+
+    try:
+        import pycuda.driver  # noqa: F401
+        import cupy  # noqa: F401
+    except ImportError as e:
+        print(f"未找到GPU依赖（{e}），此测试需要pycuda和cupy，跳过")
+        return
+
     try:
         # 测试GPU检测
         gpu_count = test_gpu_detection()